@@ -1,3 +1,25 @@
+import codecs
+import hashlib
+import inspect
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+
+TABLE_CACHE_MAGIC = b'LR0T'
+TABLE_CACHE_VERSION = 2
+TABLE_ARRAYS = ('action_base', 'action_check', 'action_next', 'default_actions',
+                'goto_base', 'goto_check', 'goto_next', 'default_gotos', 'rhs_lengths', 'lhs_gotos')
+TABLE_CACHE_KEYS = {'version', 'grammar', 'byteorder', 'sizes', 'terminals', 'nonterminals', 'lhs_symbols'}
+
 class Grammar:
     def __init__(self):
         self.productions = {}
@@ -25,11 +47,100 @@ class Grammar:
             if symbol not in self.nonterminals:
                 self.terminals.add(symbol)
 
+    def fingerprint(self):
+        data = json.dumps([self.start_symbol, sorted(self.terminals),
+                           [[lhs, list(rhs)] for lhs, rhs in self.production_list]])
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+class Lexer:
+    # Longest-match lexer over a grammar's terminals. Terminals match literally unless
+    # patterns maps them to a regex; on equal lengths a literal beats a pattern.
+    # Chunked input gives the same tokens as the whole text, except that re cannot tell
+    # whether a pattern would match more once more characters arrive. Tokens are only
+    # decided with lookahead characters after their start, so pattern tokens of up to
+    # lookahead characters are always found whole.
+    def __init__(self, terminals, patterns=None, skip=r'\s+', chunk_size=65536, lookahead=0):
+        self.patterns = {terminal: re.compile(pattern) for terminal, pattern in (patterns or {}).items()}
+        literals = sorted((t for t in terminals if t and t not in self.patterns), key=lambda t: (-len(t), t))
+        self.literals = re.compile('|'.join(map(re.escape, literals))) if literals else None
+        # Text at the end of a chunk that a longer literal starts with is held back
+        self.literal_prefixes = {literal[:i] for literal in literals for i in range(1, len(literal))}
+        self.longest_literal = len(literals[0]) if literals else 0
+        self.lookahead = lookahead
+        self.skip = re.compile(skip) if skip else None
+        self.chunk_size = chunk_size
+
+    def _match(self, buffer, pos):
+        best_terminal, best_end = None, pos
+        if self.literals:
+            match = self.literals.match(buffer, pos)
+            if match and match.end() > pos:
+                best_terminal, best_end = match.group(), match.end()
+        for terminal, pattern in self.patterns.items():
+            match = pattern.match(buffer, pos)
+            if match and match.end() > best_end:
+                best_terminal, best_end = terminal, match.end()
+        return best_terminal, best_end
+
+    def scan(self, source):
+        # Yields (terminal, lexeme) pairs. source is a string, an iterable of string
+        # chunks or a text file; a token may span chunk boundaries. Characters that
+        # match nothing are yielded as their own token so the parser reports them.
+        if isinstance(source, str):
+            chunks = iter((source,))
+        elif hasattr(source, 'read'):
+            chunks = iter(lambda: source.read(self.chunk_size), '')
+        else:
+            chunks = iter(source)
+
+        buffer = ''
+        for chunk in chunks:
+            buffer += chunk
+            end = 0
+            for terminal, lexeme, end in self.scan_buffer(buffer, final=False):
+                yield terminal, lexeme
+            buffer = buffer[end:]
+        for terminal, lexeme, _ in self.scan_buffer(buffer, final=True):
+            yield terminal, lexeme
+
+    def scan_buffer(self, buffer, pos=0, final=True):
+        # Yields (terminal, lexeme, end) for the tokens in buffer. Unless final, stops
+        # at a token or skipped run that reaches the end of buffer, or at the start of
+        # a longer literal, because they could still grow with the next chunk; the
+        # caller keeps buffer[end:] for later.
+        while pos < len(buffer):
+            if self.skip:
+                match = self.skip.match(buffer, pos)
+                if match and match.end() > pos:
+                    if match.end() == len(buffer) and not final:
+                        return
+                    pos = match.end()
+                    continue
+
+            terminal, end = self._match(buffer, pos)
+            if not final:
+                rest = len(buffer) - pos
+                if (end == len(buffer) or rest < self.lookahead
+                        or rest < self.longest_literal and buffer[pos:] in self.literal_prefixes):
+                    return
+            if terminal is None:
+                terminal, end = buffer[pos], pos + 1
+            yield terminal, buffer[pos:end], end
+            pos = end
+
+    def tokenize(self, source):
+        for terminal, _ in self.scan(source):
+            yield terminal
+
 class State:
-    def __init__(self, items):
+    __slots__ = ('items', 'kernel', 'transitions', 'actions', 'reduction')
+
+    def __init__(self, items, kernel=None):
         self.items = frozenset(items)
+        self.kernel = frozenset(kernel) if kernel is not None else self.items
         self.transitions = {}  # symbol -> state_id
-        self.actions = {}      # terminal -> (action, value)
+        self.actions = {}      # terminal -> (action, value) for shifts and accept
+        self.reduction = None  # production reduced on every other terminal
 
     def __eq__(self, other):
         return self.items == other.items
@@ -44,6 +155,8 @@ class State:
         self.actions[symbol] = action_pair
 
 class Item:
+    __slots__ = ('lhs', 'rhs', 'dot_pos', 'prod_id')
+
     def __init__(self, lhs, rhs, dot_pos, prod_id):
         self.lhs = lhs
         self.rhs = tuple(rhs)
@@ -72,71 +185,543 @@ class Item:
         rhs_with_dot.insert(self.dot_pos, '•')
         return f"{self.lhs} -> {' '.join(rhs_with_dot)}"
 
+class CompactState:
+    # Items are ints (prod_id << dot_bits | dot_pos) and only the kernel is kept
+    __slots__ = ('kernel', 'transitions', 'actions', 'reduction', 'parser')
+
+    def __init__(self, kernel, parser):
+        self.kernel = kernel
+        self.transitions = {}  # symbol -> state_id
+        self.actions = {}      # terminal -> (action, value) for shifts and accept
+        self.reduction = None  # production reduced on every other terminal
+        self.parser = parser
+
+    def __eq__(self, other):
+        return self.kernel == other.kernel
+
+    def __hash__(self):
+        return hash(self.kernel.tobytes())
+
+    @property
+    def items(self):
+        return frozenset(self.parser.decode_item(code)
+                         for code in self.parser.compact_closure(self.kernel))
+
+    def add_transition(self, symbol, state_id):
+        self.transitions[symbol] = state_id
+
+    def add_action(self, symbol, action_pair):
+        self.actions[symbol] = action_pair
+
+class StepTrace:
+    # Trace sink for LRParser.parse that keeps every step in memory
+    def __init__(self):
+        self.steps = []  # (stack, token, action, value)
+
+    def __call__(self, stack, token, action, value):
+        self.steps.append((tuple(stack), token, action, value))
+
+class ParseTree:
+    # Parse tree stored as parallel arrays indexed by node id. A node's children are
+    # children[first_child:first_child + child_count]; a leaf has production -1 and
+    # child_count 0, and its first_child holds the token's position in the input.
+    # Symbol ids index names: terminals first, then nonterminals.
+    def __init__(self, names):
+        self.names = names
+        self.symbols = array('q')
+        self.productions = array('q')
+        self.first_child = array('q')
+        self.child_count = array('q')
+        self.children = array('q')
+        self.root = -1
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def symbol(self, node):
+        return self.names[self.symbols[node]]
+
+    def children_of(self, node):
+        start = self.first_child[node]
+        return self.children[start:start + self.child_count[node]]
+
+    def is_leaf(self, node):
+        return self.productions[node] < 0
+
+    def to_tuple(self, node=None):
+        # Same nested (lhs, children) form as LRParser.parse. Children always come
+        # before their parent, so one pass in node order needs no recursion.
+        if node is None:
+            node = self.root
+        built = {}
+        for n in range(node + 1):
+            if self.productions[n] < 0:
+                built[n] = self.names[self.symbols[n]]
+            else:
+                built[n] = (self.names[self.symbols[n]], tuple(built.pop(c) for c in self.children_of(n)))
+        return built[node]
+
+class Metrics:
+    # Opt-in counters for LRParser(metrics=Metrics()). instrument() wraps the phase and
+    # hot-path methods on that parser instance only, so parsers built without metrics run
+    # the plain methods. It is also a parse trace sink counting actions per state and production.
+    PHASES = ('_compute_first_sets', '_compute_follow_sets', 'build_parsing_table', 'compile_tables',
+              'save_item_sets', 'save_parse_table', 'load_table_cache', 'save_table_cache',
+              '_update_sets', '_update_automaton')
+    COUNTED = ('closure', 'compact_closure', 'goto_kernel', '_register_state', '_register_compact_state')
+
+    def __init__(self):
+        self.phases = {}      # method -> seconds, including the phases it calls
+        self.calls = {}       # method -> calls
+        self.closure_cache_hits = 0
+        self.state_hits = 0   # gotos that reached an existing state
+        self.table_cache_hits = 0
+        self.shifts = {}      # state_id -> shifts out of that state
+        self.reductions = {}  # prod_id -> reductions by that production
+        self.errors = {}      # state_id -> syntax errors in that state
+        self.accepts = 0
+
+    def instrument(self, parser):
+        for name in self.PHASES:
+            setattr(parser, name, self._timed(name, getattr(parser, name)))
+        for name in self.COUNTED:
+            setattr(parser, name, self._counted(name, getattr(parser, name), parser))
+
+    def _timed(self, name, method):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+            if name == 'load_table_cache' and result:
+                self.table_cache_hits += 1
+            return result
+        return timed
+
+    def _counted(self, name, method, parser):
+        def counted(*args):
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if name == 'closure' and frozenset(args[0]) in parser.closure_cache:
+                self.closure_cache_hits += 1
+            result = method(*args)
+            if name.startswith('_register') and not result[1]:
+                self.state_hits += 1
+            return result
+        return counted
+
+    def count(self, state_id, action, value):
+        if action == 'shift':
+            self.shifts[state_id] = self.shifts.get(state_id, 0) + 1
+        elif action == 'reduce':
+            self.reductions[value] = self.reductions.get(value, 0) + 1
+        elif action == 'accept':
+            self.accepts += 1
+        elif action == 'error':
+            self.errors[state_id] = self.errors.get(state_id, 0) + 1
+
+    def __call__(self, stack, token, action, value):
+        self.count(stack[-1], action, value)
+
+    def as_dict(self):
+        closure_calls = self.calls.get('closure', 0)
+        state_lookups = self.calls.get('_register_state', 0) + self.calls.get('_register_compact_state', 0)
+        return {
+            'phases': dict(self.phases),
+            'calls': dict(self.calls),
+            'closure_cache': {'lookups': closure_calls, 'hits': self.closure_cache_hits,
+                              'hit_rate': self.closure_cache_hits / closure_calls if closure_calls else None},
+            'state_index': {'lookups': state_lookups, 'hits': self.state_hits,
+                            'hit_rate': self.state_hits / state_lookups if state_lookups else None},
+            'table_cache_hits': self.table_cache_hits,
+            'shifts': dict(self.shifts),
+            'reductions': dict(self.reductions),
+            'errors': dict(self.errors),
+            'accepts': self.accepts,
+        }
+
+    def to_json(self, indent=None):
+        return json.dumps(self.as_dict(), indent=indent)
+
+class TokenIndex:
+    # Positions of every token in a token list. find() returns the first position at or
+    # after pos holding one of the given terminals; callers move forward through the list,
+    # so each terminal's cursor only advances and all lookups together cost O(len(tokens))
+    # plus O(len(terminals)) per call.
+    def __init__(self, tokens):
+        self.positions = {}
+        for pos, token in enumerate(tokens):
+            self.positions.setdefault(token, []).append(pos)
+        self.cursors = dict.fromkeys(self.positions, 0)
+
+    def find(self, terminals, pos):
+        best = None
+        for terminal in terminals:
+            positions = self.positions.get(terminal)
+            if positions is None:
+                continue
+            i = self.cursors[terminal]
+            if i and positions[i - 1] >= pos:
+                i = bisect_left(positions, pos)  # moved backwards
+            while i < len(positions) and positions[i] < pos:
+                i += 1
+            self.cursors[terminal] = i
+            if i < len(positions) and (best is None or positions[i] < best):
+                best = positions[i]
+        return best
+
 class LRParser:
-    def __init__(self, grammar=None):
+    closure_cache_size = 4096
+    parallel_level_size = 64  # states per worker below which a level is expanded in-process
+    trace_width = 40  # stack entries and input tokens shown in a parsing_steps.txt row
+
+    def __init__(self, grammar=None, compact=False, cache_dir=None, write_reports=True, metrics=None,
+                 lazy=False, build_workers=1):
+        if lazy and write_reports:
+            # The reports list every state, so they would force an eager build
+            raise ValueError("lazy=True needs write_reports=False")
         self.grammar = grammar if grammar else Grammar()
+        self.compact = compact
+        self.build_workers = build_workers  # processes for compact-mode construction
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.instrument(self)
+        self.grammar_hash = self.grammar.fingerprint()
         self.original_productions = list(self.grammar.production_list)
+        self._augment()
         self.states = []
-        self.follow_sets = {}
-        self.first_sets = {}
+        self.state_index = {}  # kernel items -> state_id
+        self.productions_by_lhs = {}
+        self.closure_items = {}  # nonterminal -> items added to a closure by it
+        self.closure_cache = OrderedDict()
+        self.symbol_ids = {}     # symbol -> small int, used in compact mode
+        self.symbol_names = []
+        self.action_base = None  # packed tables filled by compile_tables()
+        self.first_masks = {}   # symbol -> FIRST as a terminal bitmask
+        self.follow_masks = {}  # nonterminal -> FOLLOW as a terminal bitmask
+        self._first_sets = None  # decoded from the masks on first use
+        self._follow_sets = None
+        self.sets_index = None  # reversed FIRST/FOLLOW edges, built by the first add_productions
+        self.sync_tables = {}   # state_id -> (sync terminals, resume terminals) for error recovery
+        self.table_cache = None  # mmap backing tables loaded from the cache
+        self.unexpanded = None  # lazy mode: ids of states created but not yet expanded
+
+        # The reports need the item sets, so a cache hit only skips construction without them
+        cache_path = os.path.join(cache_dir, f"{self.grammar_hash}.lr0") if cache_dir else None
+        cache_tried = cache_path and not write_reports
+        if cache_tried and self.load_table_cache(cache_path):
+            return
+        if lazy:
+            # States are expanded as the parse reaches them; nothing is cached until complete
+            self.build_automaton(lazy=True)
+            return
 
+        self.build_automaton()
+        # A cache that could not be used (stale, another byte order, truncated) is replaced
+        if cache_path and (cache_tried or not os.path.exists(cache_path)):
+            os.makedirs(cache_dir, exist_ok=True)
+            self.save_table_cache(cache_path)
+        if write_reports:
+            self.save_item_sets()
+            self.save_parse_table()
+
+    def _augment(self):
+        # The parser keeps its own production list with S' -> S as production 0, so the
+        # grammar object is never modified
+        self.augmented_start = f"{self.grammar.start_symbol}'"
+        self.production_list = [(self.augmented_start, (self.grammar.start_symbol,))]
+        self.production_list.extend(self.grammar.production_list)
+
+    def build_automaton(self, lazy=False):
         self._compute_first_sets()
         self._compute_follow_sets()
-        self.build_parsing_table()
-        self.save_item_sets()
-        self.save_parse_table()
+        self.build_parsing_table(lazy)
+
+    def _ensure_automaton(self):
+        # Parsers loaded from the table cache build the states only when a report needs them.
+        # A lazy automaton numbers states in visiting order, so reports rebuild it eagerly.
+        if not self.states or self.unexpanded is not None:
+            self.build_automaton()
+            self.action_base = None
+
+    def expand_all(self):
+        # Completes a lazy automaton, keeping the ids already assigned
+        if self.unexpanded is not None:
+            unexpanded, self.unexpanded = self.unexpanded, None
+            if not self.compact:
+                for state_id in unexpanded:
+                    kernel = self.states[state_id].kernel
+                    self.states[state_id] = State(self.closure(kernel), kernel)
+            self._expand_states(deque(sorted(unexpanded)))
+
+    def _expand(self, state_id):
+        self.unexpanded.discard(state_id)
+        new_states = []
+        if self.compact:
+            self._expand_compact_state(state_id, new_states)
+        else:
+            kernel = self.states[state_id].kernel
+            self.states[state_id] = State(self.closure(kernel), kernel)
+            self._expand_state(state_id, new_states)
+        self.unexpanded.update(new_states)
+
+    def add_production(self, lhs, rhs):
+        self.add_productions([(lhs, rhs)])
+
+    def add_productions(self, productions):
+        # Adds (lhs, rhs) pairs to the grammar and updates FIRST/FOLLOW and the automaton in
+        # place. New productions get the next ids and only the states whose closure can predict
+        # them are rebuilt, so state numbering can differ from a fresh LRParser. Reports are not
+        # rewritten. A new lhs that used to be a terminal, a first production, a parser loaded
+        # from the table cache or (in compact mode) a rhs too long for the item codes falls
+        # back to a full build; a lazy automaton is started over, which costs nothing.
+        productions = [(lhs, tuple(rhs)) for lhs, rhs in productions]
+        lazy = self.unexpanded is not None
+        full = (lazy or not self.states or self.grammar.start_symbol is None
+                or any(lhs in self.grammar.terminals for lhs, _ in productions)
+                or (self.compact and any(len(rhs) > self.dot_mask for _, rhs in productions)))
+        if not full and self.sets_index is None:
+            self._build_sets_index()
+        old_terminals = set(self.grammar.terminals)
+        for lhs, rhs in productions:
+            self.grammar.add_production(lhs, rhs)
+        self.grammar.compute_terminals()
+        self.grammar_hash = self.grammar.fingerprint()
+        self.original_productions = list(self.grammar.production_list)
+        self.action_base = None
+        self.table_cache = None
+        if full:
+            self._augment()
+            self.build_automaton(lazy)
+            return
+
+        first_id = len(self.production_list)
+        self.production_list.extend(productions)
+        new_terminals = sorted(self.grammar.terminals - old_terminals)
+        self._update_sets(productions, new_terminals)
+        self._update_automaton(range(first_id, len(self.production_list)))
+
+    def _compute_nullable(self):
+        # Count the symbols of each production not yet known to be nullable
+        nullable = set()
+        remaining = []
+        occurrences = {}
+        pending = []
+        for prod_id, (lhs, rhs) in enumerate(self.grammar.production_list):
+            remaining.append(len(rhs))
+            for symbol in rhs:
+                occurrences.setdefault(symbol, []).append(prod_id)
+            if not rhs and lhs not in nullable:
+                nullable.add(lhs)
+                pending.append(lhs)
+        while pending:
+            for prod_id in occurrences.get(pending.pop(), ()):
+                remaining[prod_id] -= 1
+                lhs = self.grammar.production_list[prod_id][0]
+                if remaining[prod_id] == 0 and lhs not in nullable:
+                    nullable.add(lhs)
+                    pending.append(lhs)
+        self.nullable = nullable
+
+    def _intern_terminals(self):
+        # Terminal sets are int bitmasks; bit i is terminal_order[i], '$' comes after the
+        # grammar's terminals and terminals added by add_productions after that
+        self.terminal_order = sorted(self.grammar.terminals) + ['$']
+        self.terminal_bits = {terminal: 1 << i for i, terminal in enumerate(self.terminal_order)}
+        self.all_terminals_mask = (1 << len(self.terminal_order)) - 1
+
+    def terminals_of(self, mask):
+        terminals = set()
+        while mask:
+            low = mask & -mask
+            terminals.add(self.terminal_order[low.bit_length() - 1])
+            mask ^= low
+        return terminals
 
     def _compute_first_sets(self):
-        self.first_sets = {symbol: set() for symbol in self.grammar.symbols}
-        for terminal in self.grammar.terminals:
-            self.first_sets[terminal] = {terminal}
-            
-        while True:
-            changes = False
-            for lhs, rhs_list in self.grammar.productions.items():
-                for rhs in rhs_list:
-                    if not rhs:  # Handle epsilon productions
-                        if '' not in self.first_sets[lhs]:
-                            self.first_sets[lhs].add('')
-                            changes = True
-                        continue
-                        
-                    # For each symbol in RHS, add its FIRST set to LHS's FIRST set
-                    first_sym = rhs[0]
-                    if first_sym in self.first_sets:
-                        for symbol in self.first_sets[first_sym] - {''}:
-                            if symbol not in self.first_sets[lhs]:
-                                self.first_sets[lhs].add(symbol)
-                                changes = True
-            
-            if not changes:
-                break
-                
+        self._intern_terminals()
+        self._compute_nullable()
+        terminal_bits = self.terminal_bits
+        nonterminals = self.grammar.nonterminals
+
+        # FIRST(A) contains FIRST(X) for every X in a nullable prefix of A's productions
+        direct = dict.fromkeys(nonterminals, 0)
+        edges = {nt: [] for nt in nonterminals}
+        for lhs, rhs in self.grammar.production_list:
+            for symbol in rhs:
+                if symbol in nonterminals:
+                    edges[lhs].append(symbol)
+                elif symbol in self.grammar.terminals:
+                    direct[lhs] |= terminal_bits[symbol]
+                if symbol not in self.nullable:
+                    break
+
+        self.first_masks = {terminal: terminal_bits[terminal] for terminal in self.grammar.terminals}
+        self.first_masks.update(_digraph(nonterminals, edges, direct))
+        self.first_edges = edges
+        self.sets_index = None
+        self._first_sets = None
+        self._compute_suffix_first_sets()
+
+    def _compute_suffix_first_sets(self):
+        self.suffix_first = {}
+        for lhs, rhs in self.grammar.production_list:
+            key = (lhs, tuple(rhs))
+            if key not in self.suffix_first:
+                self.suffix_first[key] = self._suffix_first(rhs)
+
+    def _suffix_first(self, rhs):
+        # FIRST mask and nullability of every rhs[pos:], built right to left
+        suffixes = [None] * (len(rhs) + 1)
+        suffixes[len(rhs)] = (0, True)
+        for pos in range(len(rhs) - 1, -1, -1):
+            symbol = rhs[pos]
+            first = self.first_masks.get(symbol, 0)
+            if symbol in self.nullable:
+                next_first, next_nullable = suffixes[pos + 1]
+                suffixes[pos] = (first | next_first, next_nullable)
+            else:
+                suffixes[pos] = (first, False)
+        return suffixes
+
     def _compute_follow_sets(self):
-        self.follow_sets = {nt: set() for nt in self.grammar.nonterminals}
-        self.follow_sets[self.grammar.start_symbol].add('$')
-        
-        while True:
-            changes = False
-            for lhs, rhs_list in self.grammar.productions.items():
-                for rhs in rhs_list:
-                    for i, symbol in enumerate(rhs):
-                        if symbol in self.grammar.nonterminals:
-                            remaining = rhs[i+1:]
-                            if remaining:
-                                first_of_remaining = self._get_first_of_sequence(remaining)
-                                for first_sym in first_of_remaining - {''}:
-                                    if first_sym not in self.follow_sets[symbol]:
-                                        self.follow_sets[symbol].add(first_sym)
-                                        changes = True
-                            if not remaining or '' in self._get_first_of_sequence(remaining):
-                                for follow_sym in self.follow_sets[lhs]:
-                                    if follow_sym not in self.follow_sets[symbol]:
-                                        self.follow_sets[symbol].add(follow_sym)
-                                        changes = True
-            
-            if not changes:
-                break
+        nonterminals = self.grammar.nonterminals
+
+        # FOLLOW(B) contains FIRST(beta) and, when beta is nullable, FOLLOW(A) for A -> alpha B beta
+        direct = dict.fromkeys(nonterminals, 0)
+        edges = {nt: [] for nt in nonterminals}
+        if self.grammar.start_symbol in direct:
+            direct[self.grammar.start_symbol] = self.terminal_bits['$']
+        for lhs, rhs in self.grammar.production_list:
+            suffixes = self.suffix_first[(lhs, tuple(rhs))]
+            for i, symbol in enumerate(rhs):
+                if symbol in nonterminals:
+                    first, nullable = suffixes[i + 1]
+                    direct[symbol] |= first
+                    if nullable and lhs != symbol:
+                        edges[symbol].append(lhs)
+
+        self.follow_masks = _digraph(nonterminals, edges, direct)
+        self.follow_edges = edges
+        self._follow_sets = None
+
+    def _build_sets_index(self):
+        # Reversed FIRST/FOLLOW edges (which sets include a given one) and the productions
+        # using each symbol, so new bits can be pushed to exactly the sets that need them
+        first_dependents = {}
+        for lhs, symbols in self.first_edges.items():
+            for symbol in symbols:
+                first_dependents.setdefault(symbol, []).append(lhs)
+        follow_dependents = {}
+        for symbol, lhs_list in self.follow_edges.items():
+            for lhs in lhs_list:
+                follow_dependents.setdefault(lhs, []).append(symbol)
+        occurrences = {}
+        for lhs, rhs in self.grammar.production_list:
+            for symbol in rhs:
+                occurrences.setdefault(symbol, set()).add((lhs, rhs))
+        self.sets_index = (first_dependents, follow_dependents, occurrences)
+
+    def _update_sets(self, productions, new_terminals):
+        # New productions only add constraints, so FIRST/FOLLOW grow from the old solution.
+        # Unless nullability changes, the old edges stay valid and only the new bits are
+        # pushed along the reversed edges.
+        for terminal in new_terminals:
+            self.terminal_bits[terminal] = 1 << len(self.terminal_order)
+            self.terminal_order.append(terminal)
+            self.first_masks[terminal] = self.terminal_bits[terminal]
+        self.all_terminals_mask = (1 << len(self.terminal_order)) - 1
+        self._first_sets = None
+        self._follow_sets = None
+        if any(lhs not in self.nullable and all(symbol in self.nullable for symbol in rhs)
+               for lhs, rhs in productions):
+            self._compute_first_sets()
+            self._compute_follow_sets()
+            return
+
+        first_dependents, follow_dependents, occurrences = self.sets_index
+        nonterminals = self.grammar.nonterminals
+        for lhs, _ in productions:
+            if lhs not in self.follow_masks:
+                self.first_masks[lhs] = self.follow_masks[lhs] = 0
+                self.first_edges[lhs] = []
+                self.follow_edges[lhs] = []
+
+        pending = []
+        for lhs, rhs in productions:
+            mask = 0
+            for symbol in rhs:
+                if symbol in nonterminals:
+                    self.first_edges[lhs].append(symbol)
+                    first_dependents.setdefault(symbol, []).append(lhs)
+                mask |= self.first_masks[symbol]
+                if symbol not in self.nullable:
+                    break
+            if mask & ~self.first_masks[lhs]:
+                self.first_masks[lhs] |= mask
+                pending.append(lhs)
+        grown = set()
+        while pending:
+            symbol = pending.pop()
+            grown.add(symbol)
+            for lhs in first_dependents.get(symbol, ()):
+                if self.first_masks[symbol] & ~self.first_masks[lhs]:
+                    self.first_masks[lhs] |= self.first_masks[symbol]
+                    pending.append(lhs)
+
+        # Productions using a grown FIRST set get new suffix masks and pass them on to FOLLOW
+        new_productions = set(productions)
+        affected = set(new_productions)
+        for symbol in grown:
+            affected.update(occurrences.get(symbol, ()))
+        for lhs, rhs in productions:
+            for symbol in rhs:
+                occurrences.setdefault(symbol, set()).add((lhs, rhs))
+        for lhs, rhs in affected:
+            suffixes = self.suffix_first[(lhs, rhs)] = self._suffix_first(rhs)
+            for i, symbol in enumerate(rhs):
+                if symbol not in nonterminals:
+                    continue
+                mask, nullable = suffixes[i + 1]
+                if nullable and lhs != symbol:
+                    if (lhs, rhs) in new_productions:
+                        self.follow_edges[symbol].append(lhs)
+                        follow_dependents.setdefault(lhs, []).append(symbol)
+                    mask |= self.follow_masks[lhs]
+                if mask & ~self.follow_masks[symbol]:
+                    self.follow_masks[symbol] |= mask
+                    pending.append(symbol)
+        while pending:
+            lhs = pending.pop()
+            for symbol in follow_dependents.get(lhs, ()):
+                if self.follow_masks[lhs] & ~self.follow_masks[symbol]:
+                    self.follow_masks[symbol] |= self.follow_masks[lhs]
+                    pending.append(symbol)
+
+    def _ensure_sets(self):
+        # Parsers loaded from the table cache compute FIRST/FOLLOW only when asked for them
+        if not self.first_masks:
+            self._compute_first_sets()
+            self._compute_follow_sets()
+
+    @property
+    def first_sets(self):
+        # Decoded from first_masks on first use; '' marks nullable nonterminals
+        if self._first_sets is None:
+            self._ensure_sets()
+            self._first_sets = {symbol: set() for symbol in self.grammar.symbols}
+            for symbol, mask in self.first_masks.items():
+                self._first_sets[symbol] = self.terminals_of(mask)
+            for nt in self.nullable:
+                self._first_sets[nt].add('')
+        return self._first_sets
+
+    @property
+    def follow_sets(self):
+        if self._follow_sets is None:
+            self._ensure_sets()
+            self._follow_sets = {nt: self.terminals_of(mask) for nt, mask in self.follow_masks.items()}
+        return self._follow_sets
 
     def _get_first_of_sequence(self, sequence):
         if not sequence:
@@ -161,119 +746,686 @@ class LRParser:
             
         return first_set
 
-    def error_recovery(self, state, stack, curr_token, pos, tokens, f):
+    def sync_table(self, state_id):
+        # Filled on the first error in each state: the FOLLOW terminals of each nonterminal
+        # the state has a GOTO on, tried in turn, and the terminals the state has an action for
+        table = self.sync_tables.get(state_id)
+        if table is None:
+            state = self.states[state_id]
+            possible_nonterminals = set(state.transitions.keys()) & self.grammar.nonterminals
+            sync = tuple(tuple(self.terminals_of(self.follow_masks.get(nt, 0))) for nt in possible_nonterminals)
+            resume = self.terminal_order if state.reduction is not None else state.actions
+            table = self.sync_tables[state_id] = (sync, tuple(resume))
+        return table
+
+    def error_recovery(self, state, stack, curr_token, pos, tokens, f, index=None):
+        # index is a TokenIndex over tokens; save_parsing_steps keeps one per input so every
+        # recovery is a few cursor moves instead of a scan of the remaining tokens
         if pos >= len(tokens):
             return pos, stack, "Error: Unexpected end of input"
             
         error_message = f"Syntax error at position {pos}, unexpected token: {curr_token}"
-        
-        current_state = self.states[stack[-1][0]]
-        possible_nonterminals = set(current_state.transitions.keys()) & self.grammar.nonterminals
-        
-        original_stack = stack.copy()
-        while stack:
-            state_id = stack[-1][0]
-            state = self.states[state_id]
-            
-            for nt in possible_nonterminals:
-                follow_symbols = self.follow_sets.get(nt, set())
-                
-                scan_pos = pos
-                while scan_pos < len(tokens):
-                    if tokens[scan_pos] in follow_symbols:
-                        error_message += f"\nRecovered by synchronizing at '{tokens[scan_pos]}'"
-                        return scan_pos, stack, error_message
-                    scan_pos += 1
-            
-            if len(stack) > 1:  
-                stack.pop()
-            else:
-                break
-        
-        stack = original_stack
-        new_pos = pos + 1
-        while new_pos < len(tokens):
-            curr_token = tokens[new_pos]
-            state = self.states[stack[-1][0]]
-            if curr_token in state.actions:
-                error_message += f"\nSkipped to token '{curr_token}'"
-                return new_pos, stack, error_message
-            new_pos += 1
+        if index is None:
+            index = TokenIndex(tokens)
+        sync, resume_terminals = self.sync_table(stack[-1][0])
+
+        for follow_terminals in sync:
+            scan_pos = index.find(follow_terminals, pos)
+            if scan_pos is not None:
+                error_message += f"\nRecovered by synchronizing at '{tokens[scan_pos]}'"
+                return scan_pos, stack, error_message
+
+        new_pos = index.find(resume_terminals, pos + 1)
+        if new_pos is not None:
+            error_message += f"\nSkipped to token '{tokens[new_pos]}'"
+            return new_pos, stack, error_message
         
         return pos + 1, [(0, '$')], error_message + "\nReset to initial state"
 
+    def _build_closure_index(self):
+        self.productions_by_lhs = {}
+        for i, (lhs, rhs) in enumerate(self.production_list):
+            self.productions_by_lhs.setdefault(lhs, []).append(i)
+
+        # Nonterminals reachable at dot position 0, including the nonterminal itself
+        first_nonterminals = {
+            nt: {self.production_list[i][1][0] for i in self.productions_by_lhs.get(nt, [])
+                 if self.production_list[i][1] and self.production_list[i][1][0] in self.grammar.nonterminals}
+            for nt in self.grammar.nonterminals
+        }
+        self.closure_items = {}
+        self.closure_nonterminals = {}
+        for nt in self.grammar.nonterminals:
+            reachable = {nt}
+            pending = [nt]
+            while pending:
+                for next_nt in first_nonterminals[pending.pop()]:
+                    if next_nt not in reachable:
+                        reachable.add(next_nt)
+                        pending.append(next_nt)
+            self.closure_nonterminals[nt] = frozenset(reachable)
+            if not self.compact:
+                self.closure_items[nt] = self._closure_items_of(nt)
+        self.closure_cache = OrderedDict()
+
+    def _closure_items_of(self, nt):
+        items = []
+        for lhs in sorted(self.closure_nonterminals[nt]):
+            for i in self.productions_by_lhs[lhs]:
+                items.append(Item(lhs, self.production_list[i][1], 0, i))
+        return frozenset(items)
+
     def closure(self, items):
-        result = set(items)
-        while True:
-            new_items = set()
-            for item in list(result):
-                if not item.is_complete():
-                    next_sym = item.next_symbol()
-                    if next_sym in self.grammar.nonterminals:
-                        for i, (lhs, rhs) in enumerate(self.grammar.production_list):
-                            if lhs == next_sym:
-                                new_items.add(Item(lhs, rhs, 0, i))
-            if not new_items - result:
-                break
-            result |= new_items
-        return frozenset(result)
+        key = frozenset(items)
+        cached = self.closure_cache.get(key)
+        if cached is not None:
+            self.closure_cache.move_to_end(key)
+            return cached
 
-    def goto(self, state_items, symbol):
+        result = set(key)
+        for item in key:
+            next_sym = item.next_symbol()
+            if next_sym in self.closure_items:
+                result |= self.closure_items[next_sym]
+        result = frozenset(result)
+
+        self.closure_cache[key] = result
+        if len(self.closure_cache) > self.closure_cache_size:
+            self.closure_cache.popitem(last=False)
+        return result
+
+    def goto_kernel(self, state_items, symbol):
         next_items = set()
         for item in state_items:
             if not item.is_complete() and item.next_symbol() == symbol:
                 next_items.add(item.advance())
+        return frozenset(next_items)
+
+    def goto(self, state_items, symbol):
+        next_items = self.goto_kernel(state_items, symbol)
         return self.closure(next_items) if next_items else None
 
-    def build_parsing_table(self):
-        augmented_start = f"{self.grammar.start_symbol}'"
-        self.grammar.production_list.insert(0, (augmented_start, [self.grammar.start_symbol]))
-        self.grammar.productions[augmented_start] = [(self.grammar.start_symbol)]
+    def _register_state(self, kernel):
+        # Kernels identify LR(0) states, so the closure is only built once per new state
+        state_id = self.state_index.get(kernel)
+        if state_id is not None:
+            return state_id, False
+        state_id = len(self.states)
+        # A lazy automaton builds the closure when the state is expanded
+        self.states.append(State(kernel if self.unexpanded is not None else self.closure(kernel), kernel))
+        self.state_index[kernel] = state_id
+        return state_id, True
+
+    def build_parsing_table(self, lazy=False):
+        self._build_closure_index()
+        self.sync_tables = {}
+        self.unexpanded = set() if lazy else None
+        if self.compact:
+            self._build_compact_table()
+            return
         
-        initial_items = self.closure({Item(augmented_start, [self.grammar.start_symbol], 0, 0)})
-        initial_state = State(initial_items)
-        self.states = [initial_state]
+        initial_kernel = frozenset({Item(self.augmented_start, [self.grammar.start_symbol], 0, 0)})
+        self.states = []
+        self.state_index = {}
+        self._register_state(initial_kernel)
+        self._expand_states(deque([0]))
+
+    def _expand_states(self, unprocessed_states):
+        # Builds the transitions and actions of each queued state, queueing the new states it
+        # reaches. A lazy automaton only records them; the driver expands them on first visit.
+        if self.unexpanded is not None:
+            self.unexpanded.update(unprocessed_states)
+            return
+        expand = self._expand_compact_state if self.compact else self._expand_state
+        while unprocessed_states:
+            expand(unprocessed_states.popleft(), unprocessed_states)
+
+    def _expand_state(self, state_idx, unprocessed_states):
+        state = self.states[state_idx]
         
-        unprocessed_states = [0]  
+        next_symbols = set()
+        for item in state.items:
+            if not item.is_complete():
+                next_sym = item.next_symbol()
+                if next_sym:
+                    next_symbols.add(next_sym)
         
-        while unprocessed_states:
-            state_idx = unprocessed_states.pop(0) 
-            state = self.states[state_idx]
-            
-            next_symbols = set()
-            for item in state.items:
-                if not item.is_complete():
-                    next_sym = item.next_symbol()
-                    if next_sym:
-                        next_symbols.add(next_sym)
-            
-            ordered_symbols = sorted(next_symbols, 
-                                key=lambda x: (x in self.grammar.terminals, x))
-            
-            for symbol in ordered_symbols:
-                next_state_items = self.goto(state.items, symbol)
-                if next_state_items:
-                    next_state = State(next_state_items)
-                    if next_state not in self.states:
-                        self.states.append(next_state)
-                        unprocessed_states.append(len(self.states) - 1)
-                    next_id = self.states.index(next_state)
-                    state.add_transition(symbol, next_id)
-                    if symbol in self.grammar.terminals:
-                        state.add_action(symbol, ('shift', next_id))
-            
-            for item in state.items:
-                if item.is_complete():
-                    if item.lhs == augmented_start:
-                        state.add_action('$', ('accept', None))
-                    else:
-                        for terminal in self.grammar.terminals | {'$'}:
-                            if terminal not in state.actions:
-                                state.add_action(terminal, ('reduce', item.prod_id))
+        ordered_symbols = sorted(next_symbols, 
+                            key=lambda x: (x in self.grammar.terminals, x))
+        
+        for symbol in ordered_symbols:
+            next_kernel = self.goto_kernel(state.items, symbol)
+            if next_kernel:
+                next_id, is_new = self._register_state(next_kernel)
+                if is_new:
+                    unprocessed_states.append(next_id)
+                state.add_transition(symbol, next_id)
+                if symbol in self.grammar.terminals:
+                    state.add_action(symbol, ('shift', next_id))
+
+        complete = sorted({item.prod_id for item in state.items if item.is_complete()})
+        self._fill_reductions(state, complete)
+
+    def _fill_reductions(self, state, prod_ids):
+        # Accept (production 0) wins on '$', then the lowest production reduces on every
+        # terminal without a shift. The reduction is kept once per state, not per terminal.
+        if prod_ids and prod_ids[0] == 0:
+            state.add_action('$', ('accept', None))
+            prod_ids = prod_ids[1:]
+        state.reduction = prod_ids[0] if prod_ids else None
+
+    def action_of(self, state, terminal):
+        # The (action, value) of state on terminal, or None for a syntax error
+        action = state.actions.get(terminal)
+        if action is None and state.reduction is not None and terminal in self.terminal_bits:
+            return ('reduce', state.reduction)
+        return action
+
+    def _intern_symbols(self):
+        # Ids follow the order used to number states: nonterminals first, then terminals.
+        # Symbols first seen in add_productions are numbered after these.
+        symbols = set(self.grammar.symbols)
+        for lhs, rhs in self.production_list:
+            symbols.add(lhs)
+            symbols.update(rhs)
+        self.symbol_names = sorted(symbols, key=lambda x: (x in self.grammar.terminals, x))
+        self.symbol_ids = {symbol: i for i, symbol in enumerate(self.symbol_names)}
+
+        max_rhs = max((len(rhs) for _, rhs in self.production_list), default=0)
+        self.dot_bits = max(max_rhs.bit_length(), 1)
+        self.dot_mask = (1 << self.dot_bits) - 1
+
+        # Duplicate productions share one id, as equal Items do in the object mode
+        canonical = {}
+        self.prod_canonical = []
+        self.prod_rhs = []
+        for i, (lhs, rhs) in enumerate(self.production_list):
+            self.prod_canonical.append(canonical.setdefault((lhs, tuple(rhs)), i))
+            self.prod_rhs.append(tuple(self.symbol_ids[symbol] for symbol in rhs))
+
+        self.closure_codes = {}
+        for nt in self.closure_nonterminals:
+            self.closure_codes[self.symbol_ids[nt]] = self._closure_codes_of(nt)
+
+    def _closure_codes_of(self, nt):
+        codes = set()
+        for lhs in self.closure_nonterminals[nt]:
+            for i in self.productions_by_lhs[lhs]:
+                codes.add(self.prod_canonical[i] << self.dot_bits)
+        return array('L', sorted(codes))
+
+    def decode_item(self, code):
+        lhs, rhs = self.production_list[code >> self.dot_bits]
+        return Item(lhs, rhs, code & self.dot_mask, code >> self.dot_bits)
+
+    def compact_closure(self, kernel):
+        result = set(kernel)
+        for code in kernel:
+            rhs = self.prod_rhs[code >> self.dot_bits]
+            dot = code & self.dot_mask
+            if dot < len(rhs) and rhs[dot] in self.closure_codes:
+                result.update(self.closure_codes[rhs[dot]])
+        return result
+
+    def _register_compact_state(self, codes):
+        kernel = array('L', sorted(codes))
+        key = kernel.tobytes()
+        state_id = self.state_index.get(key)
+        if state_id is not None:
+            return state_id, False
+        state_id = len(self.states)
+        self.states.append(CompactState(kernel, self))
+        self.state_index[key] = state_id
+        return state_id, True
+
+    def _build_compact_table(self):
+        self._intern_symbols()
+        self.states = []
+        self.state_index = {}
+        self._register_compact_state([0])
+        if self.build_workers > 1 and self.unexpanded is None:
+            self._build_compact_levels()
+        else:
+            self._expand_states(deque([0]))
+
+    def _build_compact_levels(self):
+        # Expands the automaton one breadth-first level at a time. Workers compute the
+        # closure and successor kernels of the level's states; the results come back in
+        # level order and new kernels are numbered here in that order, which is the order
+        # the serial queue would have reached them.
+        tables = (self.dot_bits, self.prod_rhs, self.closure_codes)
+        frontier = [0]
+        with ProcessPoolExecutor(self.build_workers, initializer=_init_expand_worker,
+                                 initargs=(tables,)) as executor:
+            while frontier:
+                kernels = [self.states[state_id].kernel.tobytes() for state_id in frontier]
+                if len(kernels) < self.parallel_level_size * self.build_workers:
+                    results = _expand_kernels(kernels, tables)
+                else:
+                    size = -(-len(kernels) // (4 * self.build_workers))
+                    chunks = [kernels[i:i + size] for i in range(0, len(kernels), size)]
+                    results = chain.from_iterable(executor.map(_expand_kernels, chunks))
+
+                next_frontier = []
+                for state_id, (successors, complete) in zip(frontier, results):
+                    targets = []
+                    for symbol_id, key in successors:
+                        next_id = self.state_index.get(key)
+                        if next_id is None:
+                            kernel = array('L')
+                            kernel.frombytes(key)
+                            next_id = self.state_index[key] = len(self.states)
+                            self.states.append(CompactState(kernel, self))
+                            next_frontier.append(next_id)
+                        targets.append((symbol_id, next_id))
+                    self._link_compact_state(self.states[state_id], targets, complete)
+                frontier = next_frontier
+
+    def _expand_compact_state(self, state_idx, unprocessed_states):
+        bits, mask = self.dot_bits, self.dot_mask
+        prod_rhs = self.prod_rhs
+        state = self.states[state_idx]
+
+        kernels = {}  # symbol id -> advanced item codes
+        complete = []
+        for code in self.compact_closure(state.kernel):
+            rhs = prod_rhs[code >> bits]
+            dot = code & mask
+            if dot < len(rhs):
+                kernels.setdefault(rhs[dot], []).append(code + 1)
+            else:
+                complete.append(code >> bits)
+        complete.sort()
+
+        targets = []
+        for symbol_id in sorted(kernels):
+            next_id, is_new = self._register_compact_state(kernels[symbol_id])
+            if is_new:
+                unprocessed_states.append(next_id)
+            targets.append((symbol_id, next_id))
+        self._link_compact_state(state, targets, complete)
+
+    def _link_compact_state(self, state, targets, complete):
+        # targets are (symbol id, next state) in symbol id order; complete holds the sorted
+        # ids of the productions completed in the state
+        for symbol_id, next_id in targets:
+            symbol = self.symbol_names[symbol_id]
+            state.add_transition(symbol, next_id)
+            if symbol in self.grammar.terminals:
+                state.add_action(symbol, ('shift', next_id))
+        self._fill_reductions(state, complete)
+
+    def _update_automaton(self, prod_ids):
+        # A state changes only if its closure predicts a nonterminal that can now reach a new
+        # production, and such a state has a transition on that nonterminal. Those states are
+        # rebuilt in place, the kernels they reach are looked up or added as new states, and
+        # every other state keeps its items, transitions and id.
+        # Reductions cover every terminal without a shift, so new terminals need no update
+        # in the states that are kept
+        changed = self._extend_closure_index(prod_ids)
+
+        unprocessed_states = deque()
+        for state_id, state in enumerate(self.states):
+            if changed.isdisjoint(state.transitions):
+                continue
+            if self.compact:
+                state.transitions = {}
+                state.actions = {}
+                state.reduction = None
+            else:
+                self.states[state_id] = State(self.closure(state.kernel), state.kernel)
+            unprocessed_states.append(state_id)
+        self._expand_states(unprocessed_states)
+        self._drop_unreachable_states()
+        self.sync_tables = {}
+
+    def _extend_closure_index(self, prod_ids):
+        # Returns the nonterminals whose closure gained items. Adding A -> C ... means every
+        # nonterminal that reaches A at dot position 0 now also reaches everything C reaches.
+        reach = self.closure_nonterminals
+        for prod_id in prod_ids:
+            lhs, rhs = self.production_list[prod_id]
+            self.productions_by_lhs.setdefault(lhs, []).append(prod_id)
+            reach.setdefault(lhs, frozenset((lhs,)))
+            if self.compact:
+                for symbol in (lhs,) + rhs:
+                    if symbol not in self.symbol_ids:
+                        self.symbol_ids[symbol] = len(self.symbol_names)
+                        self.symbol_names.append(symbol)
+                self.prod_canonical.append(self.production_list.index((lhs, rhs)))
+                self.prod_rhs.append(tuple(self.symbol_ids[symbol] for symbol in rhs))
+
+        changed = set()
+        for prod_id in prod_ids:
+            lhs, rhs = self.production_list[prod_id]
+            predicting = [nt for nt, reachable in reach.items() if lhs in reachable]
+            changed.update(predicting)
+            if rhs and rhs[0] in self.grammar.nonterminals:
+                for nt in predicting:
+                    reach[nt] = reach[nt] | reach[rhs[0]]
+
+        self.closure_cache.clear()
+        for nt in changed:
+            if self.compact:
+                self.closure_codes[self.symbol_ids[nt]] = self._closure_codes_of(nt)
+            else:
+                self.closure_items[nt] = self._closure_items_of(nt)
+        return changed
+
+    def _drop_unreachable_states(self):
+        # Rebuilt states may no longer lead to some old kernels. Those states are removed and
+        # the ones after them renumbered, keeping their order.
+        reachable = bytearray(len(self.states))
+        reachable[0] = 1
+        pending = [0]
+        while pending:
+            for next_id in self.states[pending.pop()].transitions.values():
+                if not reachable[next_id]:
+                    reachable[next_id] = 1
+                    pending.append(next_id)
+        if 0 not in reachable:
+            return
+
+        first_dropped = reachable.index(0)
+        new_ids = array('q', bytes(8 * len(self.states)))
+        states = []
+        for state_id, state in enumerate(self.states):
+            if reachable[state_id]:
+                new_ids[state_id] = len(states)
+                states.append(state)
+        for state in states:
+            if all(next_id < first_dropped for next_id in state.transitions.values()):
+                continue
+            state.transitions = {symbol: new_ids[next_id] for symbol, next_id in state.transitions.items()}
+            state.actions = {terminal: ('shift', new_ids[action[1]]) if action[0] == 'shift' else action
+                             for terminal, action in state.actions.items()}
+        self.states = states
+        self.state_index = {kernel: new_ids[state_id] for kernel, state_id in self.state_index.items()
+                            if reachable[state_id]}
+
+    def compile_tables(self):
+        self.expand_all()
+        # ACTION values: 0 error, n > 0 shift to n - 1, n < 0 reduce production -n - 1, and
+        # reducing the augmented production 0 (-1) is accept. Each state keeps its reduction
+        # as a single default; only the other entries are packed by row displacement.
+        # A reduction always has a GOTO, so GOTO needs no error entries.
+        terminals = sorted(self.grammar.terminals) + ['$']
+        nonterminals = sorted({lhs for lhs, _ in self.production_list})
+        self.terminal_index = {terminal: i for i, terminal in enumerate(terminals)}
+        self.nonterminal_index = {nt: i for i, nt in enumerate(nonterminals)}
+
+        action_rows = []
+        goto_columns = [{} for _ in nonterminals]  # nonterminal -> {state: next state}
+        self.default_actions = array('q', bytes(8 * len(self.states)))
+        terminal_index = self.terminal_index
+        nonterminal_index = self.nonterminal_index
+        for state_id, state in enumerate(self.states):
+            # Shifts come from the transitions and the state's reduction is its default
+            row = {}
+            for symbol, next_id in state.transitions.items():
+                if symbol in terminal_index:
+                    row[terminal_index[symbol]] = next_id + 1
+                else:
+                    goto_columns[nonterminal_index[symbol]][state_id] = next_id
+            if '$' in state.actions:
+                row[terminal_index['$']] = -1
+            if state.reduction is not None:
+                self.default_actions[state_id] = -state.reduction - 1
+            action_rows.append(row)
+
+        # GOTO is packed by nonterminal, around the most common target of each one
+        self.default_gotos = array('q', bytes(8 * len(nonterminals)))
+        for nt, column in enumerate(goto_columns):
+            if column:
+                targets = list(column.values())
+                default = max(set(targets), key=targets.count)
+                self.default_gotos[nt] = default
+                goto_columns[nt] = {state_id: next_id for state_id, next_id in column.items()
+                                    if next_id != default}
+
+        self.action_base, self.action_check, self.action_next = _pack_rows(action_rows, len(terminals))
+        self.goto_base, self.goto_check, self.goto_next = _pack_rows(goto_columns, len(self.states))
+        self.rhs_lengths = array('q', (len(rhs) for _, rhs in self.production_list))
+        self.lhs_gotos = array('q', (self.nonterminal_index[lhs]
+                                     for lhs, _ in self.production_list))
+        self.lhs_symbols = [lhs for lhs, _ in self.production_list]
+
+    def parse_tables(self):
+        # Plain picklable tuple used by recognize_tokens and the batch workers
+        if self.action_base is None:
+            self.compile_tables()
+        return tuple(getattr(self, name) for name in TABLE_ARRAYS) + (self.terminal_index,)
+
+    def recognize(self, tokens):
+        if self.unexpanded is not None:
+            return self._parse_lazy(tokens, self.metrics, build=False)[0]
+        if self.metrics is not None:
+            # The counting driver is slower, so it only runs when metrics were asked for
+            return parse_tokens(self.parse_tables(), self.lhs_symbols, tokens, self.metrics) is not None
+        return recognize_tokens(self.parse_tables(), tokens)
+
+    def save_table_cache(self, path):
+        self.parse_tables()
+        meta = json.dumps({
+            'version': TABLE_CACHE_VERSION,
+            'grammar': self.grammar_hash,
+            'byteorder': sys.byteorder,
+            'sizes': [len(getattr(self, name)) for name in TABLE_ARRAYS],
+            'terminals': list(self.terminal_index),
+            'nonterminals': list(self.nonterminal_index),
+            'lhs_symbols': self.lhs_symbols,
+        }).encode('utf-8')
+        meta += b' ' * (-(len(TABLE_CACHE_MAGIC) + 8 + len(meta)) % 8)  # keep the tables 8-byte aligned
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(TABLE_CACHE_MAGIC)
+            f.write(struct.pack('<II', TABLE_CACHE_VERSION, len(meta)))
+            f.write(meta)
+            for name in TABLE_ARRAYS:
+                f.write(array('q', getattr(self, name)).tobytes())
+        os.replace(tmp_path, path)
+
+    def load_table_cache(self, path):
+        try:
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+
+        header_size = len(TABLE_CACHE_MAGIC) + 8
+        if len(data) < header_size or data[:len(TABLE_CACHE_MAGIC)] != TABLE_CACHE_MAGIC:
+            return False
+        version, meta_size = struct.unpack('<II', data[len(TABLE_CACHE_MAGIC):header_size])
+        if version != TABLE_CACHE_VERSION:
+            return False
+        try:
+            meta = json.loads(data[header_size:header_size + meta_size])
+        except ValueError:
+            return False
+        if not isinstance(meta, dict) or not TABLE_CACHE_KEYS <= meta.keys():
+            return False
+        if meta['grammar'] != self.grammar_hash or meta['byteorder'] != sys.byteorder:
+            return False
+
+        sizes = meta['sizes']
+        if (not isinstance(sizes, list) or len(sizes) != len(TABLE_ARRAYS)
+                or not all(isinstance(size, int) and size >= 0 for size in sizes)):
+            return False
+        table_bytes = len(data) - header_size - meta_size
+        if table_bytes != 8 * sum(sizes):
+            return False
+        ints = memoryview(data)[header_size + meta_size:].cast('q')
+
+        offset = 0
+        for name, size in zip(TABLE_ARRAYS, sizes):
+            setattr(self, name, ints[offset:offset + size])
+            offset += size
+        self.terminal_index = {terminal: i for i, terminal in enumerate(meta['terminals'])}
+        self.nonterminal_index = {nt: i for i, nt in enumerate(meta['nonterminals'])}
+        self.lhs_symbols = meta['lhs_symbols']
+        self.table_cache = data
+        return True
+
+    def recognize_batch(self, inputs, workers=None, chunksize=1000):
+        # Yields (input, accepted) in input order. Inputs are consumed lazily and
+        # each worker process receives the tables once, through the initializer.
+        tables = tuple(array('q', table) if isinstance(table, memoryview) else table
+                       for table in self.parse_tables())
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                 initargs=(tables,)) as executor:
+            max_pending = 2 * workers
+            pending = deque()
+            inputs = iter(inputs)
+            while True:
+                while len(pending) < max_pending:
+                    chunk = list(islice(inputs, chunksize))
+                    if not chunk:
+                        break
+                    pending.append((chunk, executor.submit(_recognize_chunk, chunk)))
+                if not pending:
+                    break
+                chunk, future = pending.popleft()
+                yield from zip(chunk, future.result())
+
+    def parse(self, tokens, trace=None):
+        # Returns the parse tree as nested (lhs, children) tuples with tokens as
+        # leaves, or None if the input is rejected. trace(stack, token, action,
+        # value) is called before every step when given; the parser's metrics
+        # are the default trace.
+        if trace is None:
+            trace = self.metrics
+        if self.unexpanded is not None:
+            return self._parse_lazy(tokens, trace)[1]
+        return parse_tokens(self.parse_tables(), self.lhs_symbols, tokens, trace)
+
+    def _parse_lazy(self, tokens, trace=None, build=True):
+        # Same steps as parse_tokens over the state objects, expanding each state the first
+        # time it is on top of the stack. Returns (accepted, tree or None).
+        states = self.states
+        unexpanded = self.unexpanded
+        production_list = self.production_list
+        stack = [0]
+        values = []
+        for token in chain(tokens, ('$',)):
+            budget = len(stack) + len(states)  # reductions before the loop check
+            while True:
+                state_id = stack[-1]
+                if state_id in unexpanded:
+                    self._expand(state_id)
+                action = self.action_of(states[state_id], token)
+                if action is None:
+                    if trace is not None:
+                        trace(stack, token, 'error', None)
+                    return False, None
+                kind, value = action
+                if trace is not None:
+                    trace(stack, token, kind, value)
+                if kind == 'shift':
+                    stack.append(value)
+                    if build:
+                        values.append(token)
+                    break
+                if kind == 'accept':
+                    return True, values[-1] if build else None
+                budget -= 1
+                if not budget:
+                    _check_reductions(self._lazy_reductions(stack, token), token)
+                lhs, rhs = production_list[value]
+                length = len(rhs)
+                if length:
+                    del stack[-length:]
+                if build:
+                    children = tuple(values[-length:]) if length else ()
+                    if length:
+                        del values[-length:]
+                    values.append((lhs, children))
+                stack.append(states[stack[-1]].transitions[lhs])
+        return False, None
+
+    def _lazy_reductions(self, stack, token):
+        # _table_reductions over the state objects, expanding states as _parse_lazy does
+        below = len(stack)
+        pushed = []
+        while True:
+            state_id = pushed[-1] if pushed else stack[below - 1]
+            if state_id in self.unexpanded:
+                self._expand(state_id)
+            action = self.action_of(self.states[state_id], token)
+            if action is None or action[0] != 'reduce':
+                return
+            lhs, rhs = self.production_list[action[1]]
+            length = len(rhs)
+            if length > len(pushed):
+                below -= length - len(pushed)
+                pushed.clear()
+            elif length:
+                del pushed[-length:]
+            next_state = self.states[pushed[-1] if pushed else stack[below - 1]].transitions[lhs]
+            yield below + len(pushed), next_state
+            pushed.append(next_state)
+
+    def parse_tree(self, tokens):
+        # Returns the parse tree as a ParseTree arena, or None if the input is rejected
+        tables = self.parse_tables()
+        return build_tree_tokens(tables, list(self.terminal_index) + list(self.nonterminal_index), tokens)
+
+    def parse_events(self, tokens, on_shift=None, on_reduce=None):
+        # on_shift(token, pos) and on_reduce(prod_id, values) are called as the parse runs;
+        # their return values replace the symbols on the stack, so only the values of
+        # the open productions are kept. Returns (accepted, value of the start symbol).
+        return reduce_tokens(self.parse_tables(), tokens, on_shift, on_reduce)
+
+    def generate_module_source(self):
+        # Standalone module with the packed tables as bytes literals and the drivers
+        tables = self.parse_tables()
+        lines = [
+            f"# Generated by LR(0)_parser.py for grammar {self.grammar_hash}. Do not edit.",
+            "import sys",
+            "from array import array",
+            "from itertools import chain",
+            "",
+            "def _table(typecode, data):",
+            "    table = array(typecode)",
+            "    table.frombytes(data)",
+            "    if sys.byteorder != 'little':",
+            "        table.byteswap()",
+            "    return table",
+            "",
+            f"GRAMMAR_HASH = {self.grammar_hash!r}",
+            f"PRODUCTIONS = {[(lhs, tuple(rhs)) for lhs, rhs in self.production_list]!r}",
+            f"LHS_SYMBOLS = {list(self.lhs_symbols)!r}",
+            f"TERMINAL_INDEX = {dict(self.terminal_index)!r}",
+        ]
+        for name, table in zip(TABLE_ARRAYS, tables):
+            typecode = _smallest_typecode(table)
+            data = array(typecode, table)
+            if sys.byteorder != 'little':
+                data.byteswap()
+            lines.append(f"{name.upper()} = _table({typecode!r}, {data.tobytes()!r})")
+        lines.append(f"TABLES = ({', '.join(name.upper() for name in TABLE_ARRAYS)}, TERMINAL_INDEX)")
+        lines.append("")
+        lines.append(inspect.getsource(_table_reductions))
+        lines.append(inspect.getsource(_check_reductions))
+        lines.append(inspect.getsource(recognize_tokens))
+        lines.append(inspect.getsource(parse_tokens))
+        lines.append("def recognize(tokens):")
+        lines.append("    return recognize_tokens(TABLES, tokens)")
+        lines.append("")
+        lines.append("def parse(tokens, trace=None):")
+        lines.append("    return parse_tokens(TABLES, LHS_SYMBOLS, tokens, trace)")
+        return '\n'.join(lines) + '\n'
+
+    def write_module(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.generate_module_source())
+
     def save_parse_table(self):
+        self._ensure_automaton()
         terminals = sorted(list(self.grammar.terminals)) 
         terminals = terminals + ['$']
-        nonterminals = list(self.grammar.nonterminals - {self.grammar.production_list[0][0]}) 
+        nonterminals = list(self.grammar.nonterminals - {self.production_list[0][0]}) 
         with open('parse_table.txt', 'w', encoding='utf-8') as f:
             f.write('STATE'.ljust(8))
             
@@ -290,7 +1442,7 @@ class LRParser:
                 f.write(f'{str(i).ljust(8)}')
                 
                 for terminal in terminals:
-                    action = state.actions.get(terminal, ('', ''))
+                    action = self.action_of(state, terminal) or ('', '')
                     cell_content = ''
                     if action[0] == 'shift':
                         cell_content = f's{action[1]}'
@@ -309,10 +1461,11 @@ class LRParser:
                 f.write('+' + '-' * 8 * (len(terminals) + len(nonterminals)) + '\n')
 
     def save_item_sets(self):
+        self._ensure_automaton()
         with open('lr0_item_sets.txt', 'w', encoding='utf-8') as f:
             f.write("Grammar Productions:\n")
             f.write("-" * 40 + "\n")
-            for i, (lhs, rhs) in enumerate(self.grammar.production_list):
+            for i, (lhs, rhs) in enumerate(self.production_list):
                 f.write(f"{i}. {lhs} -> {' '.join(rhs)}\n")
             f.write("\n")
 
@@ -320,7 +1473,7 @@ class LRParser:
                 f.write(f"I{i}:\n")
                 f.write("-" * 40 + "\n")
                 
-                sorted_items = sorted(state.items, key=lambda item: (item.lhs != f"{self.grammar.start_symbol}'", item.prod_id))
+                sorted_items = sorted(state.items, key=lambda item: (item.lhs != self.augmented_start, item.prod_id, item.dot_pos))
                 for item in sorted_items:
                     f.write(f"{item.to_string()}\n")
 
@@ -338,11 +1491,18 @@ class LRParser:
                 f.write("\n")
 
     def save_parsing_steps(self, filename, input_string):
+        self._ensure_automaton()
         tokens = list(input_string) + ['$']
         stack = [(0, '$')] 
         pos = 0
-        max_steps = len(tokens) * 3  
-        step_count = 0
+        index = TokenIndex(tokens)
+        # Reductions between two shifts loop forever if they push a state that is still on
+        # the stack from an earlier reduction, or push the same state twice at one position
+        # while everything below it stays put. reduced holds [position, state there, states
+        # pushed there] for each position written by a reduction since the last shift, so
+        # every step either consumes input or is caught by these checks.
+        reduced = []
+        reduced_states = set()
         
         with open(filename, 'a', encoding='utf-8') as f:
             f.write(f"\nParsing of input string: {input_string}\n")
@@ -350,11 +1510,15 @@ class LRParser:
             f.write(f"{'Stack'.ljust(25)}{'Input'.ljust(20)}{'Action'.ljust(15)}\n")
             f.write("-" * 60 + "\n")
             
-            while pos <= len(tokens) and step_count < max_steps:
-                step_count += 1
-                
-                stack_str = ''.join(f"{sym}{state}" for state, sym in stack)
-                input_str = ''.join(tokens[pos:]) if pos < len(tokens) else "$"
+            width = self.trace_width
+            while pos <= len(tokens):
+                # Only the top of the stack and the next tokens, so every row has a bounded size
+                stack_str = ''.join(f"{sym}{state}" for state, sym in stack[-width:])
+                if len(stack) > width:
+                    stack_str = '...' + stack_str
+                input_str = ''.join(tokens[pos:pos + width]) if pos < len(tokens) else "$"
+                if pos + width < len(tokens):
+                    input_str += '...'
                 
                 if not stack:
                     f.write(f"Error: Empty stack encountered\n")
@@ -368,30 +1532,34 @@ class LRParser:
                     
                 curr_token = tokens[pos]
                 
-                if curr_token not in state.actions:
+                if self.action_of(state, curr_token) is None:
                     f.write(f"{stack_str.ljust(25)}{input_str.ljust(20)}{'ERROR'.ljust(15)}\n")
+                    if self.metrics is not None:
+                        self.metrics.count(stack[-1][0], 'error', None)
                     try:
-                        new_pos, new_stack, error_msg = self.error_recovery(state, stack, curr_token, pos, tokens, f)
+                        new_pos, new_stack, error_msg = self.error_recovery(state, stack, curr_token, pos, tokens, f, index)
                     except Exception as e:
                         f.write(f"Error recovery failed: {str(e)}\n")
                         return False
                     
                     f.write(f"Error Recovery: {error_msg}\n")
                     
-                    if new_pos == pos and new_stack == stack:
+                    if new_pos == pos and new_stack is stack:
                         f.write("Unable to recover from error\n")
                         return False
                     
                     pos = new_pos
                     stack = new_stack
+                    reduced.clear()
+                    reduced_states.clear()
                     continue
                 
-                action, value = state.actions[curr_token]
+                action, value = self.action_of(state, curr_token)
                 
                 if action == 'shift':
                     action_str = f"shift {value}"
                 elif action == 'reduce':
-                    lhs, rhs = self.grammar.production_list[value]
+                    lhs, rhs = self.production_list[value]
                     action_str = f"reduce {value}"
                 elif action == 'accept':
                     action_str = "accept"
@@ -399,13 +1567,17 @@ class LRParser:
                     action_str = "ERROR"
                 
                 f.write(f"{stack_str.ljust(25)}{input_str.ljust(20)}{action_str.ljust(15)}\n")
+                if self.metrics is not None:
+                    self.metrics.count(stack[-1][0], action, value)
                 
                 try:
                     if action == 'shift':
                         stack.append((value, curr_token))
                         pos += 1
+                        reduced.clear()
+                        reduced_states.clear()
                     elif action == 'reduce':
-                        lhs, rhs = self.grammar.production_list[value]
+                        lhs, rhs = self.production_list[value]
                         if len(stack) < len(rhs):
                             f.write("Error: Stack underflow during reduction\n")
                             return False
@@ -416,6 +1588,20 @@ class LRParser:
                             f.write(f"Error: Invalid transition for {lhs}\n")
                             return False
                         next_state = prev_state.transitions[lhs]
+                        while reduced and reduced[-1][0] > len(stack):
+                            reduced_states.discard(reduced.pop()[1])
+                        if reduced and reduced[-1][0] == len(stack):
+                            entry = reduced[-1]
+                            reduced_states.discard(entry[1])
+                        else:
+                            entry = [len(stack), None, set()]
+                            reduced.append(entry)
+                        if next_state in reduced_states or next_state in entry[2]:
+                            f.write(f"Error: Reductions on '{curr_token}' repeat without consuming input\n")
+                            return False
+                        entry[1] = next_state
+                        entry[2].add(next_state)
+                        reduced_states.add(next_state)
                         stack.append((next_state, lhs))
                     elif action == 'accept':
                         f.write("Input accepted!\n")
@@ -427,19 +1613,16 @@ class LRParser:
                     f.write(f"Error during parsing: {str(e)}\n")
                     return False
             
-            if step_count >= max_steps:
-                f.write("Error: Maximum parsing steps exceeded\n")
-                return False
-            
             return True
 
     def parse_and_save(self, test_strings, output_file='parsing_steps.txt'):
+        self._ensure_automaton()
         try:
             # Clear the file first
             with open(output_file, 'w', encoding='utf-8') as f:
                 f.write("Grammar Productions:\n")
                 f.write("-" * 60 + "\n")
-                for i, (lhs, rhs) in enumerate(self.grammar.production_list):
+                for i, (lhs, rhs) in enumerate(self.production_list):
                     f.write(f"{i}. {lhs} -> {' '.join(rhs)}\n")
                 f.write("\n")
             
@@ -465,6 +1648,614 @@ class LRParser:
             print(f"Error during parsing: {str(e)}")
             raise
     
+class IncrementalSession:
+    # Keeps the stack seen before every token so an edit resumes from the token where it
+    # starts. Stacks are hash-consed nodes (state, parent): equal stacks get the same id,
+    # so once the stack after an edit matches the previous run at the same token the rest
+    # of that run is reused.
+    def __init__(self, parser, tokens=()):
+        self.tables = parser.parse_tables()
+        self.tokens = list(tokens)
+        self.accepted = False
+        self.reparsed = 0  # tokens read by the last parse or edit
+        self._reset()
+
+    def _reset(self):
+        self.node_state = array('q')
+        self.node_parent = array('q')
+        self.nodes = {}  # (state, parent) -> node id
+        self.checkpoints = array('q')  # stack node before token i is read
+        self._run(0, self._push(0, -1))
+
+    def _push(self, state, parent):
+        key = (state, parent)
+        node = self.nodes.get(key)
+        if node is None:
+            node = self.nodes[key] = len(self.node_state)
+            self.node_state.append(state)
+            self.node_parent.append(parent)
+        return node
+
+    def _reductions(self, node, column):
+        # _table_reductions from the stack ending at node
+        (action_base, action_check, action_next, default_actions, goto_base, goto_check,
+         goto_next, default_gotos, rhs_lengths, lhs_gotos, terminal_index) = self.tables
+        height = 0  # relative to the stack at node
+        while True:
+            state = self.node_state[node]
+            index = action_base[state] + column
+            action = action_next[index] if action_check[index] == state else default_actions[state]
+            if action >= -1:
+                return
+            prod_id = -action - 1
+            for _ in range(rhs_lengths[prod_id]):
+                node = self.node_parent[node]
+            height -= rhs_lengths[prod_id]
+            nt = lhs_gotos[prod_id]
+            index = goto_base[nt] + self.node_state[node]
+            next_state = goto_next[index] if goto_check[index] == nt else default_gotos[nt]
+            yield height, next_state
+            node = self._push(next_state, node)
+            height += 1
+
+    def edit(self, start, end, new_tokens):
+        # Replaces tokens[start:end] with new_tokens and returns whether the input is accepted
+        new_tokens = list(new_tokens)
+        old_checkpoints = self.checkpoints
+        self.tokens[start:end] = new_tokens
+        if len(self.nodes) > 4 * len(self.tokens) + 65536:
+            self._reset()
+            return self.accepted
+        if start >= len(old_checkpoints):
+            # The previous run failed before the edit, and still does
+            self.reparsed = 0
+            return self.accepted
+        self.checkpoints = old_checkpoints[:start]
+        resync = (start + len(new_tokens), len(new_tokens) - (end - start),
+                  old_checkpoints, self.accepted)
+        self._run(start, old_checkpoints[start], resync)
+        return self.accepted
+
+    def _run(self, pos, node, resync=None):
+        (action_base, action_check, action_next, default_actions, goto_base, goto_check,
+         goto_next, default_gotos, rhs_lengths, lhs_gotos, terminal_index) = self.tables
+        node_state = self.node_state
+        node_parent = self.node_parent
+        checkpoints = self.checkpoints
+        tokens = self.tokens
+        resync_from, delta, old_checkpoints, old_accepted = resync or (len(tokens) + 1, 0, None, None)
+
+        for i in range(pos, len(tokens) + 1):
+            if i >= resync_from and i - delta < len(old_checkpoints) and old_checkpoints[i - delta] == node:
+                checkpoints.extend(old_checkpoints[i - delta:])
+                self.accepted = old_accepted
+                self.reparsed = i - pos
+                return
+            checkpoints.append(node)
+            column = terminal_index.get(tokens[i] if i < len(tokens) else '$')
+            if column is None:
+                self.accepted = False
+                self.reparsed = i - pos + 1
+                return
+            budget = len(default_actions)  # reductions before the loop check
+            while True:
+                state = node_state[node]
+                index = action_base[state] + column
+                action = action_next[index] if action_check[index] == state else default_actions[state]
+                if action > 0:
+                    node = self._push(action - 1, node)
+                    break
+                if action == 0 or action == -1:
+                    self.accepted = action == -1
+                    self.reparsed = i - pos + 1
+                    return
+                prod_id = -action - 1
+                budget -= 1
+                if not budget:
+                    _check_reductions(self._reductions(node, column), tokens[i] if i < len(tokens) else '$')
+                for _ in range(rhs_lengths[prod_id]):
+                    node = node_parent[node]
+                nt = lhs_gotos[prod_id]
+                index = goto_base[nt] + node_state[node]
+                next_state = goto_next[index] if goto_check[index] == nt else default_gotos[nt]
+                node = self._push(next_state, node)
+        self.accepted = False
+        self.reparsed = len(tokens) + 1 - pos
+
+class ParserSession:
+    # Push parser: input arrives through feed() and the parse advances as far as it can.
+    # The compiled tables are only read, so any number of sessions can share one parser.
+    # A session holds its stack, the lexer's unfinished text and, when callbacks are
+    # given, the values of the open productions.
+    def __init__(self, parser, lexer=None, on_token=None, on_reduce=None, encoding='utf-8'):
+        self.tables = parser.parse_tables()
+        self.lexer = lexer
+        # on_token(token, lexeme) takes the place of parse_events' on_shift(token, pos), since
+        # a session reads lexemes rather than a token list; lexeme is the token without a lexer
+        self.on_token = on_token
+        self.on_reduce = on_reduce  # on_reduce(prod_id, values), as in LRParser.parse_events
+        self.decoder = codecs.getincrementaldecoder(encoding)() if lexer is not None else None
+        self.buffer = ''
+        self.stack = [0]
+        self.values = [] if on_token is not None or on_reduce is not None else None
+        self.tokens_read = 0
+        self.accepted = None  # True or False once decided
+        self.value = None
+
+    def feed(self, chunk):
+        # chunk is text or bytes with a lexer, otherwise an iterable of tokens.
+        # Returns False as soon as the input is rejected; later chunks are ignored.
+        if self.accepted is not None:
+            return self.accepted
+        if self.lexer is None:
+            for token in chunk:
+                if not self._push(token, token):
+                    return False
+            return True
+        if isinstance(chunk, bytes):
+            chunk = self.decoder.decode(chunk)
+        self.buffer += chunk
+        end = 0
+        for terminal, lexeme, end in self.lexer.scan_buffer(self.buffer, final=False):
+            if not self._push(terminal, lexeme):
+                return False
+        self.buffer = self.buffer[end:]
+        return True
+
+    def finish(self):
+        # Ends the input and returns whether it was accepted
+        if self.accepted is None and self.lexer is not None:
+            tail = self.buffer + self.decoder.decode(b'', final=True)
+            self.buffer = ''
+            for terminal, lexeme, _ in self.lexer.scan_buffer(tail):
+                if not self._push(terminal, lexeme):
+                    break
+        if self.accepted is None:
+            self._push('$', '$')
+        return self.accepted
+
+    async def consume(self, source, size=65536):
+        # Feeds an asyncio StreamReader (read until EOF) or any async iterable of
+        # chunks, stopping early on rejection, and returns finish()
+        if hasattr(source, 'read'):
+            while True:
+                chunk = await source.read(size)
+                if not chunk:
+                    break
+                if not self.feed(chunk):
+                    return False
+        else:
+            async for chunk in source:
+                if not self.feed(chunk):
+                    return False
+        return self.finish()
+
+    def _push(self, token, lexeme):
+        (action_base, action_check, action_next, default_actions, goto_base, goto_check,
+         goto_next, default_gotos, rhs_lengths, lhs_gotos, terminal_index) = self.tables
+        stack = self.stack
+        values = self.values
+        column = terminal_index.get(token)
+        if column is None:
+            self.accepted = False
+            return False
+        budget = len(stack) + len(default_actions)  # reductions before the loop check
+        while True:
+            state = stack[-1]
+            i = action_base[state] + column
+            action = action_next[i] if action_check[i] == state else default_actions[state]
+            if action > 0:
+                stack.append(action - 1)
+                if values is not None:
+                    values.append(self.on_token(token, lexeme) if self.on_token is not None else lexeme)
+                self.tokens_read += 1
+                return True
+            if action == 0:
+                self.accepted = False
+                return False
+            if action == -1:
+                self.accepted = True
+                if values is not None:
+                    self.value = values[-1]
+                return True
+            prod_id = -action - 1
+            budget -= 1
+            if not budget:
+                _check_reductions(_table_reductions(self.tables, stack, column), token)
+            length = rhs_lengths[prod_id]
+            if length:
+                del stack[-length:]
+            if values is not None:
+                args = values[-length:] if length else []
+                if length:
+                    del values[-length:]
+                values.append(self.on_reduce(prod_id, args) if self.on_reduce is not None else None)
+            state = stack[-1]
+            nt = lhs_gotos[prod_id]
+            i = goto_base[nt] + state
+            stack.append(goto_next[i] if goto_check[i] == nt else default_gotos[nt])
+
+def _digraph(nodes, edges, direct):
+    # DeRemer-Pennello Digraph over bitmasks: F(x) = direct(x) | F(y) for every edge x -> y.
+    # Members of a strongly connected component share one result and every edge is followed once.
+    result = {}
+    depth = dict.fromkeys(nodes, 0)
+    position = {}
+    done = len(depth) + 1
+    stack = []
+
+    def visit(node):
+        stack.append(node)
+        depth[node] = position[node] = len(stack)
+        result[node] = direct[node]
+        return node, iter(edges[node])
+
+    for root in nodes:
+        if depth[root]:
+            continue
+        work = [visit(root)]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if depth[child] == 0:
+                    work.append(visit(child))
+                    break
+                depth[node] = min(depth[node], depth[child])
+                result[node] |= result[child]
+            else:
+                work.pop()
+                if depth[node] == position[node]:
+                    while True:
+                        member = stack.pop()
+                        depth[member] = done
+                        if member == node:
+                            break
+                        result[member] = result[node]
+                if work:
+                    parent = work[-1][0]
+                    depth[parent] = min(depth[parent], depth[node])
+                    result[parent] |= result[node]
+    return result
+
+def _pack_rows(rows, n_columns):
+    # Row displacement: row r (a dict column -> value) is placed at base[r] so that no two
+    # rows share a slot; check[base[r] + column] == r marks the slots that belong to row r.
+    base = array('q', bytes(8 * len(rows)))
+    used = bytearray()
+    first_free = 0
+    for r in sorted(range(len(rows)), key=lambda r: -len(rows[r])):
+        columns = sorted(rows[r])
+        if not columns:
+            continue
+        offset = max(first_free - columns[0], 0)
+        while True:
+            # Jump straight to the next offset where the first column lands on a free slot
+            free = used.find(0, offset + columns[0])
+            if free < 0:
+                offset = max(offset, len(used) - columns[0])
+                break
+            offset = free - columns[0]
+            if not any(offset + column < len(used) and used[offset + column] for column in columns):
+                break
+            offset += 1
+        base[r] = offset
+        top = offset + columns[-1] + 1
+        if top > len(used):
+            used.extend(bytes(top - len(used)))
+        for column in columns:
+            used[offset + column] = 1
+        while first_free < len(used) and used[first_free]:
+            first_free += 1
+
+    size = max(base, default=0) + n_columns
+    check = array('q', [-1]) * size
+    values = array('q', bytes(8 * size))
+    for r, row in enumerate(rows):
+        for column, value in row.items():
+            check[base[r] + column] = r
+            values[base[r] + column] = value
+    return base, check, values
+
+def _table_reductions(tables, stack, column):
+    # Yields (height, state) for each reduction the tables make on column from stack until
+    # the next shift, accept or error: the stack height after the pops and the state pushed.
+    # stack is only read; the states pushed since are kept apart.
+    (action_base, action_check, action_next, default_actions, goto_base, goto_check,
+     goto_next, default_gotos, rhs_lengths, lhs_gotos, terminal_index) = tables
+    below = len(stack)  # stack[:below] is still in place
+    pushed = []
+    while True:
+        state = pushed[-1] if pushed else stack[below - 1]
+        i = action_base[state] + column
+        action = action_next[i] if action_check[i] == state else default_actions[state]
+        if action >= -1:
+            return
+        prod_id = -action - 1
+        length = rhs_lengths[prod_id]
+        if length > len(pushed):
+            below -= length - len(pushed)
+            pushed.clear()
+        elif length:
+            del pushed[-length:]
+        state = pushed[-1] if pushed else stack[below - 1]
+        nt = lhs_gotos[prod_id]
+        i = goto_base[nt] + state
+        next_state = goto_next[i] if goto_check[i] == nt else default_gotos[nt]
+        yield below + len(pushed), next_state
+        pushed.append(next_state)
+
+def _check_reductions(reductions, token):
+    # The drivers call this once the reductions on one token outnumber the states plus
+    # the stack height they started from, which a run that ends rarely does; it follows
+    # the rest of the run and raises ValueError if it never ends, as save_parsing_steps
+    # does: the run loops if it pushes a state that is still on the stack from an earlier
+    # reduction, or pushes the same state twice at one height while everything below it
+    # stays put. reduced holds [height, state there, states pushed there] for each height
+    # written since the check started, so every reduction either ends the run or is caught.
+    reduced = []
+    reduced_states = set()
+    for height, next_state in reductions:
+        while reduced and reduced[-1][0] > height:
+            reduced_states.discard(reduced.pop()[1])
+        if reduced and reduced[-1][0] == height:
+            entry = reduced[-1]
+            reduced_states.discard(entry[1])
+        else:
+            entry = [height, None, set()]
+            reduced.append(entry)
+        if next_state in reduced_states or next_state in entry[2]:
+            raise ValueError(f"Reductions on '{token}' loop without consuming input in state {next_state}")
+        entry[1] = next_state
+        entry[2].add(next_state)
+        reduced_states.add(next_state)
+
+def recognize_tokens(tables, tokens):
+    (action_base, action_check, action_next, default_actions, goto_base, goto_check,
+     goto_next, default_gotos, rhs_lengths, lhs_gotos, terminal_index) = tables
+
+    n_states = len(default_actions)
+    stack = [0]
+    for token in chain(tokens, ('$',)):
+        column = terminal_index.get(token)
+        if column is None:
+            return False
+        budget = len(stack) + n_states  # reductions before the loop check
+        while True:
+            state = stack[-1]
+            i = action_base[state] + column
+            action = action_next[i] if action_check[i] == state else default_actions[state]
+            if action > 0:
+                stack.append(action - 1)
+                break
+            if action == 0:
+                return False
+            if action == -1:
+                return True
+            prod_id = -action - 1
+            budget -= 1
+            if not budget:
+                _check_reductions(_table_reductions(tables, stack, column), token)
+            length = rhs_lengths[prod_id]
+            if length:
+                del stack[-length:]
+            state = stack[-1]
+            nt = lhs_gotos[prod_id]
+            i = goto_base[nt] + state
+            stack.append(goto_next[i] if goto_check[i] == nt else default_gotos[nt])
+    return False
+
+def parse_tokens(tables, lhs_symbols, tokens, trace=None):
+    (action_base, action_check, action_next, default_actions, goto_base, goto_check,
+     goto_next, default_gotos, rhs_lengths, lhs_gotos, terminal_index) = tables
+
+    n_states = len(default_actions)
+    stack = [0]
+    values = []
+    for token in chain(tokens, ('$',)):
+        column = terminal_index.get(token)
+        if column is None:
+            if trace is not None:
+                trace(stack, token, 'error', None)
+            return None
+        budget = len(stack) + n_states  # reductions before the loop check
+        while True:
+            state = stack[-1]
+            i = action_base[state] + column
+            action = action_next[i] if action_check[i] == state else default_actions[state]
+            if action > 0:
+                if trace is not None:
+                    trace(stack, token, 'shift', action - 1)
+                stack.append(action - 1)
+                values.append(token)
+                break
+            if action == 0:
+                if trace is not None:
+                    trace(stack, token, 'error', None)
+                return None
+            if action == -1:
+                if trace is not None:
+                    trace(stack, token, 'accept', None)
+                return values[-1]
+            prod_id = -action - 1
+            budget -= 1
+            if not budget:
+                _check_reductions(_table_reductions(tables, stack, column), token)
+            if trace is not None:
+                trace(stack, token, 'reduce', prod_id)
+            length = rhs_lengths[prod_id]
+            if length:
+                children = tuple(values[-length:])
+                del values[-length:]
+                del stack[-length:]
+            else:
+                children = ()
+            values.append((lhs_symbols[prod_id], children))
+            state = stack[-1]
+            nt = lhs_gotos[prod_id]
+            i = goto_base[nt] + state
+            stack.append(goto_next[i] if goto_check[i] == nt else default_gotos[nt])
+    return None
+
+def build_tree_tokens(tables, names, tokens):
+    (action_base, action_check, action_next, default_actions, goto_base, goto_check,
+     goto_next, default_gotos, rhs_lengths, lhs_gotos, terminal_index) = tables
+
+    tree = ParseTree(names)
+    symbols = tree.symbols
+    add_symbol = symbols.append
+    add_prod_id = tree.productions.append
+    add_first_child = tree.first_child.append
+    add_child_count = tree.child_count.append
+    children = tree.children
+    n_terminals = len(terminal_index)
+    n_states = len(default_actions)
+    stack = [0]
+    nodes = []
+    for pos, token in enumerate(chain(tokens, ('$',))):
+        column = terminal_index.get(token)
+        if column is None:
+            return None
+        budget = len(stack) + n_states  # reductions before the loop check
+        while True:
+            state = stack[-1]
+            i = action_base[state] + column
+            action = action_next[i] if action_check[i] == state else default_actions[state]
+            if action > 0:
+                stack.append(action - 1)
+                nodes.append(len(symbols))
+                add_symbol(column)
+                add_prod_id(-1)
+                add_first_child(pos)
+                add_child_count(0)
+                break
+            if action == 0:
+                return None
+            if action == -1:
+                tree.root = nodes[-1]
+                return tree
+            prod_id = -action - 1
+            budget -= 1
+            if not budget:
+                _check_reductions(_table_reductions(tables, stack, column), token)
+            length = rhs_lengths[prod_id]
+            add_first_child(len(children))
+            if length:
+                children.extend(nodes[-length:])
+                del nodes[-length:]
+                del stack[-length:]
+            nodes.append(len(symbols))
+            add_symbol(n_terminals + lhs_gotos[prod_id])
+            add_prod_id(prod_id)
+            add_child_count(length)
+            state = stack[-1]
+            nt = lhs_gotos[prod_id]
+            i = goto_base[nt] + state
+            stack.append(goto_next[i] if goto_check[i] == nt else default_gotos[nt])
+    return None
+
+def reduce_tokens(tables, tokens, on_shift=None, on_reduce=None):
+    (action_base, action_check, action_next, default_actions, goto_base, goto_check,
+     goto_next, default_gotos, rhs_lengths, lhs_gotos, terminal_index) = tables
+
+    n_states = len(default_actions)
+    stack = [0]
+    values = []
+    for pos, token in enumerate(chain(tokens, ('$',))):
+        column = terminal_index.get(token)
+        if column is None:
+            return False, None
+        budget = len(stack) + n_states  # reductions before the loop check
+        while True:
+            state = stack[-1]
+            i = action_base[state] + column
+            action = action_next[i] if action_check[i] == state else default_actions[state]
+            if action > 0:
+                stack.append(action - 1)
+                values.append(on_shift(token, pos) if on_shift is not None else token)
+                break
+            if action == 0:
+                return False, None
+            if action == -1:
+                return True, values[-1]
+            prod_id = -action - 1
+            budget -= 1
+            if not budget:
+                _check_reductions(_table_reductions(tables, stack, column), token)
+            length = rhs_lengths[prod_id]
+            if length:
+                args = values[-length:]
+                del values[-length:]
+                del stack[-length:]
+            else:
+                args = []
+            values.append(on_reduce(prod_id, args) if on_reduce is not None else None)
+            state = stack[-1]
+            nt = lhs_gotos[prod_id]
+            i = goto_base[nt] + state
+            stack.append(goto_next[i] if goto_check[i] == nt else default_gotos[nt])
+    return False, None
+
+_expand_tables = None
+
+def _init_expand_worker(tables):
+    global _expand_tables
+    _expand_tables = tables
+
+def _expand_kernels(kernels, tables=None):
+    # For each compact kernel (bytes of sorted item codes) returns its successor kernels as
+    # (symbol id, kernel bytes) in symbol id order and its sorted completed productions,
+    # the same grouping LRParser._expand_compact_state does
+    bits, prod_rhs, closure_codes = tables or _expand_tables
+    mask = (1 << bits) - 1
+    results = []
+    for key in kernels:
+        kernel = array('L')
+        kernel.frombytes(key)
+        closure = set(kernel)
+        for code in kernel:
+            rhs = prod_rhs[code >> bits]
+            dot = code & mask
+            if dot < len(rhs) and rhs[dot] in closure_codes:
+                closure.update(closure_codes[rhs[dot]])
+
+        successors = {}
+        complete = []
+        for code in closure:
+            rhs = prod_rhs[code >> bits]
+            dot = code & mask
+            if dot < len(rhs):
+                successors.setdefault(rhs[dot], []).append(code + 1)
+            else:
+                complete.append(code >> bits)
+        complete.sort()
+        results.append(([(symbol_id, array('L', sorted(successors[symbol_id])).tobytes())
+                         for symbol_id in sorted(successors)], complete))
+    return results
+
+def _smallest_typecode(table):
+    low = min(table, default=0)
+    high = max(table, default=0)
+    for typecode in ('b', 'h', 'i'):
+        bits = array(typecode).itemsize * 8 - 1
+        if -(1 << bits) <= low and high < (1 << bits):
+            return typecode
+    return 'q'
+
+_batch_tables = None
+
+def _init_batch_worker(tables):
+    global _batch_tables
+    _batch_tables = tables
+
+def _recognize_chunk(chunk):
+    results = []
+    for tokens in chunk:
+        try:
+            results.append(recognize_tokens(_batch_tables, tokens))
+        except Exception:
+            results.append(False)
+    return results
+
 def get_user_grammar():
     print("\nEnter grammar productions in the format: LHS -> RHS")
     print("Use space to separate symbols in RHS")
@@ -521,7 +2312,6 @@ def main():
     if not test_strings:
         return
     print("see \"parsing_steps.txt\" for results ;)")
-    for input_str in test_strings:
-        parser.parse_and_save(test_strings)
+    parser.parse_and_save(test_strings)
 if __name__ == "__main__":
     main()
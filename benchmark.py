@@ -0,0 +1,802 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+spec = importlib.util.spec_from_file_location(
+    'lr0_parser', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'LR(0)_parser.py'))
+lr0 = importlib.util.module_from_spec(spec)
+sys.modules['lr0_parser'] = lr0
+spec.loader.exec_module(lr0)
+
+def chain_grammar(depth):
+    # A0 -> a A1 | b, A1 -> a A2 | b, ... gives about 3 states per level
+    grammar = lr0.Grammar()
+    for i in range(depth):
+        grammar.add_production(f'A{i}', ['a', f'A{i + 1}'])
+        grammar.add_production(f'A{i}', ['b'])
+    grammar.add_production(f'A{depth}', ['b'])
+    grammar.compute_terminals()
+    return grammar
+
+def precedence_grammar(levels):
+    # E0 -> E0 op0 E1 | E1, ..., En -> ( E0 ) | id: every closure spans all levels
+    grammar = lr0.Grammar()
+    for i in range(levels):
+        grammar.add_production(f'E{i}', [f'E{i}', f'op{i}', f'E{i + 1}'])
+        grammar.add_production(f'E{i}', [f'E{i + 1}'])
+    grammar.add_production(f'E{levels}', ['(', 'E0', ')'])
+    grammar.add_production(f'E{levels}', ['id'])
+    grammar.compute_terminals()
+    return grammar
+
+def nullable_chain_grammar(depth):
+    # A0 -> B0 A1 c | A1, B0 -> b | <empty>, ...: FIRST flows up the whole chain
+    # through nullable prefixes, FOLLOW flows down it
+    grammar = lr0.Grammar()
+    for i in range(depth):
+        grammar.add_production(f'A{i}', [f'B{i}', f'A{i + 1}', 'c'])
+        grammar.add_production(f'A{i}', [f'A{i + 1}'])
+        grammar.add_production(f'B{i}', ['b'])
+        grammar.add_production(f'B{i}', [])
+    grammar.add_production(f'A{depth}', ['a'])
+    grammar.compute_terminals()
+    return grammar
+
+def expression_grammar():
+    grammar = lr0.Grammar()
+    grammar.add_production('E', ['E', '+', 'T'])
+    grammar.add_production('E', ['T'])
+    grammar.add_production('T', ['T', '*', 'F'])
+    grammar.add_production('T', ['F'])
+    grammar.add_production('F', ['(', 'E', ')'])
+    grammar.add_production('F', ['id'])
+    grammar.compute_terminals()
+    return grammar
+
+def expression_tokens(n_terms):
+    # id + id * ( id + id ) + ... with about 4 tokens per term
+    tokens = ['id']
+    for i in range(1, n_terms):
+        if i % 3 == 0:
+            tokens += ['*', '(', 'id', '+', 'id', ')']
+        else:
+            tokens += ['+', 'id']
+    return tokens
+
+def alternation_grammar(width):
+    # S -> S A | A, A -> t0 | t1 | ...: one state with width shifts and width reduce states
+    grammar = lr0.Grammar()
+    grammar.add_production('S', ['S', 'A'])
+    grammar.add_production('S', ['A'])
+    for i in range(width):
+        grammar.add_production('A', [f't{i}'])
+    grammar.compute_terminals()
+    return grammar
+
+def right_list_grammar(kinds):
+    # List -> Item sep List | Item: the stack grows with the input and unwinds at the end
+    grammar = lr0.Grammar()
+    grammar.add_production('List', ['Item', 'sep', 'List'])
+    grammar.add_production('List', ['Item'])
+    for i in range(kinds):
+        grammar.add_production('Item', [f'w{i}'])
+    grammar.compute_terminals()
+    return grammar
+
+def precedence_input(levels, length, rng):
+    tokens = []
+    open_parens = 0
+    while True:
+        while open_parens < 20 and rng.random() < 0.2:
+            tokens.append('(')
+            open_parens += 1
+        tokens.append('id')
+        while open_parens and rng.random() < 0.3:
+            tokens.append(')')
+            open_parens -= 1
+        if len(tokens) >= length:
+            break
+        tokens.append(f'op{rng.randrange(levels)}')
+    return tokens + [')'] * open_parens
+
+def alternation_input(width, length, rng):
+    return [f't{rng.randrange(width)}' for _ in range(max(length, 1))]
+
+def right_list_input(kinds, length, rng):
+    tokens = [f'w{rng.randrange(kinds)}']
+    while len(tokens) < length:
+        tokens += ['sep', f'w{rng.randrange(kinds)}']
+    return tokens
+
+def invalid_input(parser, tokens, rng):
+    # Replaces, deletes or inserts one token until the parser rejects the result
+    terminals = sorted(parser.grammar.terminals)
+    for _ in range(100):
+        mutated = list(tokens)
+        pos = rng.randrange(len(mutated))
+        kind = rng.randrange(3)
+        if kind == 0:
+            mutated[pos] = rng.choice(terminals)
+        elif kind == 1:
+            del mutated[pos]
+        else:
+            mutated.insert(pos, rng.choice(terminals))
+        if not parser.recognize(mutated):
+            return mutated
+    mutated = list(tokens)
+    mutated[len(mutated) // 2] = '<unknown>'
+    return mutated
+
+# name -> (grammar generator, input generator, default grammar sizes)
+SUITE = {
+    'precedence': (precedence_grammar, precedence_input, [25, 50, 100]),
+    'alternation': (alternation_grammar, alternation_input, [100, 500, 2000]),
+    'right_list': (right_list_grammar, right_list_input, [10, 100, 1000]),
+}
+
+class TableOnlyParser(lr0.LRParser):
+    # Skips the report files so only the automaton construction is measured
+    def build_parsing_table(self, lazy=False):
+        start = time.perf_counter()
+        super().build_parsing_table(lazy)
+        self.build_time = time.perf_counter() - start
+
+    def save_item_sets(self):
+        pass
+
+    def save_parse_table(self):
+        pass
+
+def bench_construction(name, grammar_fn, sizes):
+    print(f"\n{name}")
+    print(f"{'size'.ljust(8)}{'mode'.ljust(10)}{'states'.ljust(10)}{'seconds'.ljust(12)}"
+          f"{'states/sec'.ljust(14)}{'peak MB'.ljust(10)}{'kept MB'.ljust(10)}")
+    print("-" * 74)
+    for size in sizes:
+        for compact in (False, True):
+            parser = TableOnlyParser(grammar_fn(size), compact=compact)
+            n_states = len(parser.states)
+            build_time = parser.build_time
+            del parser
+
+            tracemalloc.start()
+            parser = TableOnlyParser(grammar_fn(size), compact=compact)
+            kept, peak = (size / 2 ** 20 for size in tracemalloc.get_traced_memory())
+            tracemalloc.stop()
+            del parser
+
+            mode = 'compact' if compact else 'object'
+            print(f"{str(size).ljust(8)}{mode.ljust(10)}{str(n_states).ljust(10)}"
+                  f"{build_time:<12.4f}{n_states / build_time:<14.0f}{peak:<10.1f}{kept:<10.1f}")
+
+class SetsOnlyParser(TableOnlyParser):
+    # Only computes FIRST/FOLLOW, timing them
+    def build_automaton(self):
+        start = time.perf_counter()
+        self._compute_first_sets()
+        self._compute_follow_sets()
+        self.sets_time = time.perf_counter() - start
+
+def bench_table_size(name, grammar_fn, sizes):
+    print(f"\npacked tables ({name})")
+    print(f"{'size'.ljust(8)}{'states'.ljust(10)}{'dense ints'.ljust(14)}{'packed ints'.ljust(14)}{'seconds'.ljust(12)}")
+    print("-" * 58)
+    for size in sizes:
+        parser = TableOnlyParser(grammar_fn(size))
+        start = time.perf_counter()
+        parser.compile_tables()
+        elapsed = time.perf_counter() - start
+        dense = len(parser.states) * (len(parser.terminal_index) + len(parser.nonterminal_index))
+        packed = sum(len(getattr(parser, table)) for table in lr0.TABLE_ARRAYS)
+        print(f"{str(size).ljust(8)}{str(len(parser.states)).ljust(10)}{str(dense).ljust(14)}"
+              f"{str(packed).ljust(14)}{elapsed:<12.4f}")
+
+def bench_first_follow(sizes):
+    print("\nFIRST/FOLLOW (nullable chain grammar)")
+    print(f"{'productions'.ljust(14)}{'seconds'.ljust(12)}")
+    print("-" * 26)
+    for depth in sizes:
+        parser = SetsOnlyParser(nullable_chain_grammar(depth), write_reports=False)
+        print(f"{str(len(parser.original_productions)).ljust(14)}{parser.sets_time:<12.4f}")
+
+def bench_parsing(lengths):
+    parser = TableOnlyParser(expression_grammar())
+    print("\nparsing (expression grammar)")
+    print(f"{'tokens'.ljust(10)}{'driver'.ljust(22)}{'seconds'.ljust(12)}{'tokens/sec'.ljust(14)}")
+    print("-" * 58)
+    with tempfile.TemporaryDirectory() as tmp:
+        steps_file = os.path.join(tmp, 'parsing_steps.txt')
+        for n_terms in lengths:
+            tokens = expression_tokens(n_terms)
+            drivers = [
+                ('save_parsing_steps', lambda: parser.save_parsing_steps(steps_file, tokens)),
+                ('recognize', lambda: parser.recognize(tokens)),
+                ('parse', lambda: parser.parse(tokens)),
+                ('parse + StepTrace', lambda: parser.parse(tokens, lr0.StepTrace())),
+            ]
+            for name, run in drivers:
+                start = time.perf_counter()
+                accepted = run()
+                elapsed = time.perf_counter() - start
+                assert accepted not in (None, False), name
+                print(f"{str(len(tokens)).ljust(10)}{name.ljust(22)}"
+                      f"{elapsed:<12.4f}{len(tokens) / elapsed:<14.0f}")
+
+def bench_streaming(n_terms):
+    parser = TableOnlyParser(expression_grammar())
+    lexer = lr0.Lexer(parser.grammar.terminals, patterns={'id': r'[A-Za-z_]\w*'})
+    text = ' '.join(expression_tokens(n_terms)).replace('id', 'name')
+    chunks = [text[i:i + 4096] for i in range(0, len(text), 4096)]
+    n_tokens = sum(1 for _ in lexer.tokenize(chunks))
+    start = time.perf_counter()
+    accepted = parser.recognize(lexer.tokenize(iter(chunks)))
+    elapsed = time.perf_counter() - start
+    assert accepted
+    print(f"\nstreaming lexer + recognize: {n_tokens} tokens in {elapsed:.4f}s "
+          f"({n_tokens / elapsed:.0f} tokens/sec)")
+
+def bench_codegen(levels):
+    parser = TableOnlyParser(precedence_grammar(levels))
+    with tempfile.TemporaryDirectory() as tmp:
+        parser.write_module(os.path.join(tmp, 'generated_parser.py'))
+        sys.path.insert(0, tmp)
+        try:
+            start = time.perf_counter()
+            module = importlib.import_module('generated_parser')
+            elapsed = time.perf_counter() - start
+        finally:
+            sys.path.remove(tmp)
+            sys.modules.pop('generated_parser', None)
+    assert module.recognize(['id', 'op0', 'id'])
+    print(f"\ngenerated module import ({levels} levels): {elapsed:.4f}s, "
+          f"construction: {parser.build_time:.4f}s")
+
+def bench_batch(n_inputs, worker_counts):
+    parser = TableOnlyParser(expression_grammar())
+    inputs = [expression_tokens(20) if i % 10 else ['id', '+'] for i in range(n_inputs)]
+    print(f"\nbatch recognize ({n_inputs} inputs, {os.cpu_count()} cpus)")
+    print(f"{'workers'.ljust(10)}{'seconds'.ljust(12)}{'inputs/sec'.ljust(14)}")
+    print("-" * 36)
+    for workers in worker_counts:
+        start = time.perf_counter()
+        for _ in parser.recognize_batch(inputs, workers=workers):
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"{str(workers).ljust(10)}{elapsed:<12.4f}{n_inputs / elapsed:<14.0f}")
+
+def bench_parallel_build(cases, worker_counts):
+    print(f"\nparallel compact construction ({os.cpu_count()} cpus)")
+    print(f"{'grammar'.ljust(13)}{'size'.ljust(8)}{'workers'.ljust(9)}{'states'.ljust(9)}{'seconds'.ljust(10)}")
+    print("-" * 49)
+    for name, size in cases:
+        grammar_fn = SUITE[name][0]
+        serial = None
+        for workers in worker_counts:
+            start = time.perf_counter()
+            parser = TableOnlyParser(grammar_fn(size), compact=True, build_workers=workers)
+            elapsed = time.perf_counter() - start
+            transitions = [state.transitions for state in parser.states]
+            serial = serial or transitions
+            assert transitions == serial, "parallel build differs from the serial one"
+            print(f"{name.ljust(13)}{str(size).ljust(8)}{str(workers).ljust(9)}{str(len(parser.states)).ljust(9)}"
+                  f"{elapsed:<10.4f}")
+
+def bench_cache(levels):
+    print(f"\ntable cache (precedence grammar, {levels} levels)")
+    print(f"{'start'.ljust(10)}{'seconds'.ljust(12)}")
+    print("-" * 22)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name in ('cold', 'warm'):
+            start = time.perf_counter()
+            lr0.LRParser(precedence_grammar(levels), cache_dir=cache_dir, write_reports=False)
+            print(f"{name.ljust(10)}{time.perf_counter() - start:<12.4f}")
+
+def bench_incremental(n_terms, n_edits):
+    # Wraps a random id in parentheses, keeping the document valid
+    parser = TableOnlyParser(expression_grammar())
+    tokens = expression_tokens(n_terms)
+    session = lr0.IncrementalSession(parser, tokens)
+    rng = random.Random(0)
+    reparsed = 0
+    start = time.perf_counter()
+    for _ in range(n_edits):
+        position = rng.randrange(len(session.tokens))
+        while session.tokens[position] != 'id':
+            position = rng.randrange(len(session.tokens))
+        assert session.edit(position, position + 1, ['(', 'id', '+', 'id', ')'])
+        reparsed += session.reparsed
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    assert parser.recognize(session.tokens)
+    full = time.perf_counter() - start
+    print(f"\nincremental reparse ({len(session.tokens)} tokens): {elapsed / n_edits * 1000:.3f}ms per edit, "
+          f"{reparsed / n_edits:.1f} tokens reparsed; full recognize {full * 1000:.3f}ms")
+
+def bench_add_production(name, grammar_fn, size, lhs, rhs):
+    print(f"\nadd {lhs} -> {' '.join(rhs)} ({name}, {size})")
+    print(f"{'mode'.ljust(10)}{'states'.ljust(10)}{'rebuild s'.ljust(12)}{'add s'.ljust(12)}")
+    print("-" * 44)
+    for compact in (False, True):
+        parser = lr0.LRParser(grammar_fn(size), compact=compact, write_reports=False)
+        start = time.perf_counter()
+        parser.add_production(lhs, rhs)
+        added = time.perf_counter() - start
+
+        grammar = grammar_fn(size)
+        grammar.add_production(lhs, rhs)
+        grammar.compute_terminals()
+        start = time.perf_counter()
+        rebuilt = lr0.LRParser(grammar, compact=compact, write_reports=False)
+        rebuild = time.perf_counter() - start
+        assert len(parser.states) == len(rebuilt.states)
+        mode = 'compact' if compact else 'object'
+        print(f"{mode.ljust(10)}{str(len(parser.states)).ljust(10)}{rebuild:<12.4f}{added:<12.4f}")
+
+def log_grammar():
+    # t(imestamp) l(evel) w(ord)... n(ewline) entries; Text is right recursive
+    grammar = lr0.Grammar()
+    grammar.add_production('Log', ['Log', 'Entry'])
+    grammar.add_production('Log', ['Entry'])
+    grammar.add_production('Entry', ['t', 'l', 'Text', 'n'])
+    grammar.add_production('Text', ['w', 'Text'])
+    grammar.add_production('Text', ['w'])
+    grammar.compute_terminals()
+    return grammar
+
+class RecoveryCountingParser(TableOnlyParser):
+    def error_recovery(self, *args):
+        self.errors += 1
+        return super().error_recovery(*args)
+
+def bench_error_recovery(sizes):
+    # A truncated last entry full of garbage: no token can follow Text, so every error
+    # falls through to skipping ahead while the stack keeps growing. Times the whole
+    # save_parsing_steps run, trace included, which should stay linear in the input.
+    parser = RecoveryCountingParser(log_grammar())
+    print("\nerror recovery (log grammar, truncated entry)")
+    print(f"{'tokens'.ljust(10)}{'errors'.ljust(10)}{'total s'.ljust(12)}{'us/token'.ljust(12)}{'trace MB'.ljust(10)}")
+    print("-" * 54)
+    with tempfile.TemporaryDirectory() as tmp:
+        steps_file = os.path.join(tmp, 'parsing_steps.txt')
+        for size in sizes:
+            text = 'tlwn' * size + 'tl' + 'wx' * size
+            parser.errors = 0
+            start = time.perf_counter()
+            parser.save_parsing_steps(steps_file, text)
+            elapsed = time.perf_counter() - start
+            trace_size = os.path.getsize(steps_file)
+            os.remove(steps_file)
+            print(f"{str(len(text)).ljust(10)}{str(parser.errors).ljust(10)}{elapsed:<12.4f}"
+                  f"{elapsed / len(text) * 1e6:<12.2f}{trace_size / 1e6:<10.1f}")
+
+def bench_metrics(levels, n_terms):
+    print(f"\nmetrics overhead (precedence grammar, {levels} levels)")
+    print(f"{'metrics'.ljust(10)}{'construct s'.ljust(14)}{'recognize s'.ljust(14)}")
+    print("-" * 38)
+    tokens = ['id'] + ['op0', 'id'] * n_terms
+    for metrics in (None, lr0.Metrics()):
+        start = time.perf_counter()
+        parser = lr0.LRParser(precedence_grammar(levels), write_reports=False, metrics=metrics)
+        parser.compile_tables()
+        construct = time.perf_counter() - start
+        start = time.perf_counter()
+        assert parser.recognize(tokens)
+        recognize = time.perf_counter() - start
+        print(f"{'on' if metrics else 'off':<10}{construct:<14.4f}{recognize:<14.4f}")
+    report = metrics.as_dict()
+    print(f"state index hit rate {report['state_index']['hit_rate']:.2f}, phases: "
+          + ', '.join(f"{name} {seconds:.4f}s" for name, seconds in report['phases'].items()))
+    hot = sorted(report['reductions'].items(), key=lambda item: -item[1])[:3]
+    print("hottest productions: " + ', '.join(
+        f"{parser.production_list[prod_id][0]} -> {' '.join(parser.production_list[prod_id][1])} ({count})"
+        for prod_id, count in hot))
+
+def bench_tree_outputs(n_terms):
+    parser = TableOnlyParser(expression_grammar())
+    tokens = expression_tokens(n_terms)
+    print(f"\nparse outputs (expression grammar, {len(tokens)} tokens)")
+    print(f"{'output'.ljust(22)}{'seconds'.ljust(12)}{'kept MB'.ljust(10)}{'peak MB'.ljust(10)}")
+    print("-" * 54)
+    counts = {}
+    def on_reduce(prod_id, values):
+        counts[prod_id] = counts.get(prod_id, 0) + 1
+    outputs = [
+        ('nested tuples', lambda: parser.parse(tokens)),
+        ('ParseTree arena', lambda: parser.parse_tree(tokens)),
+        ('on_reduce callbacks', lambda: parser.parse_events(tokens, on_reduce=on_reduce)[0]),
+    ]
+    parser.parse_tables()
+    for name, run in outputs:
+        start = time.perf_counter()
+        assert run() not in (None, False), name
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        result = run()
+        kept, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        print(f"{name.ljust(22)}{elapsed:<12.4f}{kept / 2 ** 20:<10.1f}{peak / 2 ** 20:<10.1f}")
+
+def bench_lazy(cases):
+    print("\ntime to first parse, eager vs lazy construction")
+    print(f"{'grammar'.ljust(13)}{'size'.ljust(7)}{'mode'.ljust(8)}{'states'.ljust(10)}{'seconds'.ljust(10)}")
+    print("-" * 48)
+    for name, size in cases:
+        grammar_fn, input_fn, _ = SUITE[name]
+        tokens = input_fn(size, 50, random.Random(0))
+        for compact in (False, True):
+            for lazy in (False, True):
+                start = time.perf_counter()
+                parser = lr0.LRParser(grammar_fn(size), compact=compact, write_reports=False, lazy=lazy)
+                assert parser.recognize(tokens)
+                elapsed = time.perf_counter() - start
+                mode = ('lazy' if lazy else 'eager') + (' c' if compact else '')
+                print(f"{name.ljust(13)}{str(size).ljust(7)}{mode.ljust(8)}{str(len(parser.states)).ljust(10)}"
+                      f"{elapsed:<10.4f}")
+
+async def _chunked(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+        await asyncio.sleep(0)
+
+def bench_sessions(n_sessions, n_terms, chunk_size):
+    parser = TableOnlyParser(expression_grammar())
+    lexer = lr0.Lexer(parser.grammar.terminals, patterns={'id': r'[A-Za-z_]\w*'})
+    data = ' '.join(expression_tokens(n_terms)).replace('id', 'name').encode('utf-8')
+    n_tokens = sum(1 for _ in lexer.tokenize(data.decode('utf-8')))
+
+    tracemalloc.start()
+    sessions = [lr0.ParserSession(parser, lexer) for _ in range(n_sessions)]
+    for session in sessions:
+        session.feed(data[:chunk_size])
+    per_session = tracemalloc.get_traced_memory()[0] / n_sessions
+    tracemalloc.stop()
+
+    async def run():
+        sessions = [lr0.ParserSession(parser, lexer) for _ in range(n_sessions)]
+        return await asyncio.gather(*(session.consume(_chunked(data, chunk_size)) for session in sessions))
+    start = time.perf_counter()
+    accepted = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    assert all(accepted)
+    print(f"\n{n_sessions} concurrent ParserSessions ({len(data)} bytes each in {chunk_size}-byte chunks): "
+          f"{elapsed:.4f}s, {n_sessions * n_tokens / elapsed:.0f} tokens/sec, "
+          f"{per_session / 1024:.1f} KB per open session")
+
+def measure(grammar_fn, input_fn, size, length, seed):
+    parser = TableOnlyParser(grammar_fn(size))
+    start = time.perf_counter()
+    parser.compile_tables()
+    build_time = parser.build_time + time.perf_counter() - start
+
+    tracemalloc.start()
+    TableOnlyParser(grammar_fn(size)).compile_tables()
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+
+    rng = random.Random(seed)
+    valid = input_fn(size, length, rng)
+    invalid = invalid_input(parser, valid, rng)
+    start = time.perf_counter()
+    assert parser.recognize(valid)
+    recognize_time = time.perf_counter() - start
+    start = time.perf_counter()
+    assert parser.parse(valid) is not None
+    parse_time = time.perf_counter() - start
+    start = time.perf_counter()
+    assert not parser.recognize(invalid)
+    reject_time = time.perf_counter() - start
+    return {
+        'states': len(parser.states),
+        'build_seconds': build_time,
+        'states_per_second': len(parser.states) / build_time,
+        'peak_mb': peak,
+        'tokens': len(valid),
+        'recognize_tokens_per_second': len(valid) / recognize_time,
+        'parse_tokens_per_second': len(valid) / parse_time,
+        'reject_seconds': reject_time,
+    }
+
+def run_suite(names, sizes, length, seed):
+    print(f"\nsuite ({length} tokens per input, seed {seed})")
+    print(f"{'grammar'.ljust(13)}{'size'.ljust(7)}{'states'.ljust(8)}{'build s'.ljust(10)}{'states/s'.ljust(10)}"
+          f"{'peak MB'.ljust(9)}{'recognize tok/s'.ljust(17)}{'parse tok/s'.ljust(13)}{'reject s'.ljust(10)}")
+    print("-" * 97)
+    results = {}
+    for name in names:
+        grammar_fn, input_fn, default_sizes = SUITE[name]
+        for size in sizes or default_sizes:
+            result = results[f"{name}:{size}"] = measure(grammar_fn, input_fn, size, length, seed)
+            print(f"{name.ljust(13)}{str(size).ljust(7)}{str(result['states']).ljust(8)}"
+                  f"{result['build_seconds']:<10.4f}{result['states_per_second']:<10.0f}{result['peak_mb']:<9.1f}"
+                  f"{result['recognize_tokens_per_second']:<17.0f}{result['parse_tokens_per_second']:<13.0f}"
+                  f"{result['reject_seconds']:<10.5f}")
+    return results
+
+# metric -> True when larger values are better
+COMPARED = {
+    'build_seconds': False,
+    'peak_mb': False,
+    'recognize_tokens_per_second': True,
+    'parse_tokens_per_second': True,
+}
+
+def compare(results, baseline, threshold):
+    # Prints how much slower (or bigger) each run is than the baseline; > 1 is worse
+    print(f"\ncompared with baseline ({baseline['meta']['python']}, {baseline['meta']['machine']})")
+    print(f"{'run'.ljust(20)}" + ''.join(metric.ljust(30) for metric in COMPARED))
+    print("-" * (20 + 30 * len(COMPARED)))
+    regressions = 0
+    for key, result in results.items():
+        old = baseline['results'].get(key)
+        if old is None:
+            continue
+        cells = []
+        for metric, higher_is_better in COMPARED.items():
+            if not old[metric] or not result[metric]:
+                cells.append('-'.ljust(30))
+                continue
+            ratio = old[metric] / result[metric] if higher_is_better else result[metric] / old[metric]
+            flag = ' !' if ratio > threshold else ''
+            regressions += bool(flag)
+            cells.append(f"{ratio:.2f}x{flag}".ljust(30))
+        print(key.ljust(20) + ''.join(cells))
+    print(f"{regressions} regression(s) above {threshold:.2f}x")
+    return regressions
+
+class StepLimit:
+    # parse() trace that fails once a parse takes more steps than any terminating one could
+    def __init__(self, limit):
+        self.left = limit
+
+    def __call__(self, stack, token, action, value):
+        self.left -= 1
+        assert self.left >= 0, "parse did not terminate"
+
+class EagerPoolParser(lr0.LRParser):
+    parallel_level_size = 0  # send every level to the pool, however small
+
+def random_productions(rng, terminals=('a', 'b', 'c')):
+    # Up to 5 nonterminals with 1-3 productions each, rhs of 0-3 symbols
+    nonterminals = [f'N{i}' for i in range(rng.randint(1, 5))]
+    symbols = nonterminals + list(terminals)
+    return [(lhs, [rng.choice(symbols) for _ in range(rng.randint(0, 3))])
+            for lhs in nonterminals for _ in range(rng.randint(1, 3))]
+
+def make_grammar(productions):
+    grammar = lr0.Grammar()
+    for lhs, rhs in productions:
+        grammar.add_production(lhs, rhs)
+    grammar.compute_terminals()
+    return grammar
+
+def random_inputs(rng, n_inputs, terminals=('a', 'b', 'c', 'z')):
+    return [[rng.choice(terminals) for _ in range(rng.randint(0, 6))] for _ in range(n_inputs)]
+
+def outcome(parse, tokens):
+    # parse(tokens), or 'loop' if it raised for reducing forever without input
+    try:
+        return parse(tokens)
+    except ValueError:
+        return 'loop'
+
+def table_drivers(parser):
+    # Every way to run the compiled tables, as functions of the tokens returning acceptance
+    module = {}
+    exec(parser.generate_module_source(), module)
+
+    def session(tokens):
+        session = lr0.ParserSession(parser, on_reduce=lambda prod_id, values: prod_id)
+        session.feed(tokens)
+        return session.finish()
+    return [parser.recognize, lambda tokens: parser.parse(tokens) is not None,
+            lambda tokens: parser.parse_tree(tokens) is not None,
+            lambda tokens: parser.parse_events(tokens)[0], session,
+            lambda tokens: lr0.IncrementalSession(parser, tokens).accepted, module['recognize']]
+
+def check_reduction_loops(n_grammars, rng):
+    # Reductions that never reach a shift must raise ValueError in every driver, and the
+    # check must not reject long runs that end or grammars whose loops the tables never take
+    for productions, tokens in (([('S', ['A', 'S']), ('A', [])], []), ([('S', ['S']), ('S', ['a'])], ['a', 'a']),
+                                ([('S', ['A']), ('A', ['S']), ('A', ['a'])], ['a', 'a'])):
+        for compact in (False, True):
+            parser = lr0.LRParser(make_grammar(productions), compact=compact, write_reports=False)
+            lazy = lr0.LRParser(make_grammar(productions), compact=compact, write_reports=False, lazy=True)
+            for parse in table_drivers(parser) + [lazy.recognize]:
+                assert outcome(parse, tokens) == 'loop', (productions, parse)
+    parser = lr0.LRParser(make_grammar([('N0', ['c', 'N1']), ('N0', ['a', 'c']), ('N1', ['N1', 'N1', 'N0']),
+                                        ('N1', [])]), write_reports=False)
+    assert [parser.recognize(tokens) for tokens in (['a', 'c'], ['c'], ['c', 'a', 'c'])] == [True, True, False]
+    grammar = right_list_grammar(20)
+    tokens = right_list_input(20, 5000, random.Random(0))
+    parser = lr0.LRParser(grammar, write_reports=False)
+    lazy = lr0.LRParser(grammar, write_reports=False, lazy=True)
+    assert all(parse(tokens) for parse in table_drivers(parser) + [lazy.recognize])
+
+    # Every driver must stop on any input, and agree on whether it loops
+    loops = 0
+    for _ in range(n_grammars):
+        productions = random_productions(rng)
+        parser = lr0.LRParser(make_grammar(productions), write_reports=False)
+        lazy = lr0.LRParser(make_grammar(productions), write_reports=False, lazy=True)
+        drivers = table_drivers(parser) + [lazy.recognize]
+        for tokens in random_inputs(rng, 20):
+            expected = outcome(lambda tokens: parser.parse(tokens, StepLimit(10000)) is not None, tokens)
+            for parse in drivers:
+                assert outcome(parse, tokens) == expected, (productions, tokens, parse)
+            loops += expected == 'loop'
+    print(f"reduction loops: {n_grammars} grammars, {loops} looping inputs caught by every driver")
+
+def check_add_productions(n_grammars, rng):
+    # Adding the productions in two batches must give the same FIRST/FOLLOW sets and
+    # language as building the whole grammar at once
+    for _ in range(n_grammars):
+        productions = random_productions(rng)
+        split = rng.randint(1, len(productions))
+        inputs = random_inputs(rng, 20)
+        for compact in (False, True):
+            parser = lr0.LRParser(make_grammar(productions[:split]), compact=compact, write_reports=False)
+            parser.add_productions(productions[split:])
+            fresh = lr0.LRParser(make_grammar(productions), compact=compact, write_reports=False)
+            assert parser.first_sets == fresh.first_sets and parser.follow_sets == fresh.follow_sets
+            for tokens in inputs:
+                assert outcome(parser.recognize, tokens) == outcome(fresh.recognize, tokens), (productions, split, tokens)
+    print(f"add_productions: {n_grammars} grammars match a fresh build")
+
+def check_parallel_build(n_grammars, rng):
+    grammars = [SUITE[name][0](size) for name, size in (('precedence', 20), ('alternation', 50),
+                                                          ('right_list', 50))]
+    grammars += [make_grammar(random_productions(rng)) for _ in range(n_grammars)]
+    for grammar in grammars:
+        serial = lr0.LRParser(grammar, compact=True, write_reports=False)
+        parallel = EagerPoolParser(grammar, compact=True, write_reports=False, build_workers=2)
+        assert [state.transitions for state in parallel.states] == [state.transitions for state in serial.states]
+        assert [state.reduction for state in parallel.states] == [state.reduction for state in serial.states]
+    print(f"parallel build: {len(grammars)} grammars match the serial build")
+
+def random_chunks(rng, text):
+    cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 6))))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+def check_lexer_chunks(n_cases, rng):
+    # Splitting the text anywhere must not change the tokens, even where a literal is
+    # a prefix of a longer one
+    assert list(lr0.Lexer({'a', 'abc', 'b', 'c'}).tokenize(['ab', 'c'])) == ['abc']
+    lexer = lr0.Lexer({'+'}, patterns={'num': r'\d+(\.\d+)?', 'dot': r'\.'}, lookahead=3)
+    assert list(lexer.scan(['1.', '5+2'])) == list(lexer.scan('1.5+2'))
+    for _ in range(n_cases):
+        terminals = {''.join(rng.choice('abc') for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 6))}
+        lexer = lr0.Lexer(terminals, skip=r' +')
+        text = ''.join(rng.choice('abc  d') for _ in range(rng.randint(0, 30)))
+        expected = list(lexer.scan(text))
+        assert list(lexer.scan(random_chunks(rng, text))) == expected, (terminals, text)
+        assert list(lexer.scan(list(text))) == expected, (terminals, text)
+    print(f"lexer: {n_cases} texts give the same tokens in chunks")
+
+def check_session_chunks(n_cases, rng):
+    # A ParserSession fed split chunks, as text or bytes, must accept what recognize accepts
+    parser = lr0.LRParser(make_grammar([('S', ['abc']), ('S', ['a', 'b'])]), write_reports=False)
+    lexer = lr0.Lexer(parser.grammar.terminals)
+    for chunks, expected in ((['ab', 'c'], True), ([b'ab', b'c'], True), (['a', 'bc'], True),
+                             (['a', 'b'], True), ([b'a', b'bc', b'c'], False)):
+        session = lr0.ParserSession(parser, lexer)
+        for chunk in chunks:
+            session.feed(chunk)
+        assert session.finish() == expected, chunks
+
+    parser = TableOnlyParser(expression_grammar())
+    lexer = lr0.Lexer(parser.grammar.terminals, patterns={'id': r'[a-z]+'})
+    for _ in range(n_cases):
+        text = ' '.join(expression_tokens(rng.randint(1, 5))).replace('id', rng.choice(['x', 'name']))
+        if rng.random() < 0.3:
+            text = text[:rng.randrange(len(text))]
+        expected = parser.recognize(lexer.tokenize(text))
+        for chunks in (random_chunks(rng, text), [chunk.encode('utf-8') for chunk in random_chunks(rng, text)]):
+            session = lr0.ParserSession(parser, lexer)
+            for chunk in chunks:
+                session.feed(chunk)
+            assert session.finish() == expected, (text, chunks)
+
+        # The same on_reduce gives the same value as parse_events
+        tokens = list(lexer.tokenize(text))
+        on_reduce = lambda prod_id, values: (prod_id, tuple(values))
+        session = lr0.ParserSession(parser, lexer, on_token=lambda token, lexeme: token, on_reduce=on_reduce)
+        session.feed(text)
+        events = parser.parse_events(tokens, lambda token, pos: token, on_reduce)
+        assert (session.finish(), session.value) == events, text
+    print(f"sessions: {n_cases} inputs give the same result in chunks")
+
+def check_lazy(n_grammars, rng):
+    # A lazy parser must parse like an eager one, and must be the same automaton once expanded
+    try:
+        lr0.LRParser(expression_grammar(), lazy=True)
+    except ValueError:
+        pass
+    else:
+        assert False, "lazy=True with reports did not raise"
+    for _ in range(n_grammars):
+        productions = random_productions(rng)
+        for compact in (False, True):
+            eager = lr0.LRParser(make_grammar(productions), compact=compact, write_reports=False)
+            lazy = lr0.LRParser(make_grammar(productions), compact=compact, write_reports=False, lazy=True)
+            for tokens in random_inputs(rng, 20):
+                assert outcome(lazy.recognize, tokens) == outcome(eager.recognize, tokens), (productions, tokens)
+                assert outcome(lazy.parse, tokens) == outcome(eager.parse, tokens), (productions, tokens)
+            lazy.expand_all()
+            assert len(lazy.states) == len(eager.states)
+    print(f"lazy construction: {n_grammars} grammars parse like an eager build")
+
+def run_checks(seed):
+    rng = random.Random(seed)
+    check_reduction_loops(300, rng)
+    check_add_productions(300, rng)
+    check_parallel_build(10, rng)
+    check_lexer_chunks(2000, rng)
+    check_session_chunks(500, rng)
+    check_lazy(300, rng)
+
+def run_all(sizes):
+    bench_construction('chain', chain_grammar, sizes or [250, 500, 1000, 2000, 4000])
+    bench_construction('precedence', precedence_grammar, sizes or [25, 50, 100, 200])
+    bench_table_size('precedence', precedence_grammar, sizes or [50, 100, 200])
+    bench_first_follow(sizes or [2500, 5000, 10000, 20000])
+    bench_parsing(sizes or [250, 1000, 4000])
+    bench_streaming(50000)
+    bench_cache(200)
+    bench_codegen(200)
+    bench_batch(50000, sorted({1, 2, os.cpu_count() or 1}))
+    bench_incremental(25000, 300)
+    bench_add_production('chain', chain_grammar, 4000, 'A2000', ['c', 'A2001'])
+    bench_add_production('precedence', precedence_grammar, 100, 'E100', ['[', 'E0', ']'])
+    bench_error_recovery(sizes or [1000, 2000, 4000, 8000])
+    bench_metrics(100, 10000)
+    bench_tree_outputs(50000)
+    bench_sessions(1000, 200, 512)
+    bench_lazy([('precedence', 200), ('alternation', 2000), ('right_list', 1000)])
+    bench_parallel_build([('precedence', 300), ('alternation', 2000), ('right_list', 3000)],
+                         sorted({1, 2, os.cpu_count() or 1}))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for LR(0)_parser.py")
+    parser.add_argument('sizes', nargs='*', type=int, help="grammar sizes, replacing the defaults")
+    parser.add_argument('--suite', action='store_true', help="only run the synthetic grammar suite")
+    parser.add_argument('--grammars', default=','.join(SUITE), help="comma separated suite grammars")
+    parser.add_argument('--length', type=int, default=20000, help="tokens per generated input")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-baseline', metavar='PATH', help="write the suite results as a baseline")
+    parser.add_argument('--baseline', metavar='PATH', help="compare the suite results with a baseline")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="ratio against the baseline reported as a regression")
+    parser.add_argument('--check', action='store_true',
+                        help="run the randomized equivalence checks instead of the benchmarks")
+    args = parser.parse_args()
+
+    if args.check:
+        run_checks(args.seed)
+        return
+
+    if not args.suite:
+        run_all(args.sizes)
+    results = run_suite(args.grammars.split(','), args.sizes, args.length, args.seed)
+
+    if args.save_baseline:
+        meta = {'python': platform.python_version(), 'machine': platform.machine(),
+                'length': args.length, 'seed': args.seed}
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()